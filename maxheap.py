@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 # https://stackoverflow.com/questions/30443150/maintain-a-fixed-size-heap-python
-from heapq import heapify, heappush, heappop, heappushpop, nlargest
+from heapq import heapify, heappush, heappop, heappushpop, heapreplace, nlargest
 
 class MaxHeap():
 
@@ -16,6 +16,22 @@ class MaxHeap():
         else:
             heappushpop(self.h, element)
 
+    def threshold(self):
+        # elements are (key, ...) tuples: once full, anything keyed below this cannot get in,
+        # so callers can skip building it at all.  None while there is still room, or with
+        # no size (0 keeps nothing - add() drops everything anyway).
+        if not self.maxsize or len(self.h) < self.maxsize: return None
+        return self.h[0][0]
+
+    def add_many(self, elements):
+        # batch insert, e.g. a directory's worth of candidates that passed threshold()
+        if not self.maxsize: return # <--- nothing kept, as with add()
+        for element in elements:
+            if len(self.h) < self.maxsize:
+                heappush(self.h, element)
+            elif element > self.h[0]:
+                heapreplace(self.h, element)
+
     def top(self, count=None):
         if not count: count = len(self.h)
         return nlargest(count, self.h)
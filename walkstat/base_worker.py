@@ -1,23 +1,123 @@
 #!/usr/bin/env python3
 
 from mpi4py import MPI
-from mpiclass import MPIClass, DirEntry, FileEntry, format_number, UIDCounts, GIDCounts
+from mpiclass import MPIClass, DirEntry, DirTally, FileEntry, format_number, UIDCounts, GIDCounts
+from sub_manager import SubManager
+from steal_engine import StealEngine
+from frontier import subtree_cost
+from throttle import TokenBucket
+from histograms import bin_sums
 import os, sys, stat
 import shutil
 import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from collections import defaultdict, deque
+from operator import attrgetter
 from typing import NamedTuple
+import numpy as np
 
+# '--send-policy fixed' thresholds, and where 'adaptive' starts out
 MAXDIRS_BEFORE_SEND = 200
 PROGRESS_INCREMENT = 20000
 
+# '--send-policy adaptive' bounds: ship discovered directories once we hold about as many as
+# the Manager has queued for each worker, and report progress about once per --progress interval
+MIN_DIRS_BEFORE_SEND = 8
+MAX_DIRS_BEFORE_SEND = 5000
+MIN_PROGRESS_INCREMENT = 1000
+MAX_PROGRESS_INCREMENT = 200000
+
+# directory entries are stat()ed, and accounted for, this many at a time
+STAT_BLOCK = 256
+
+# blocks of at least this many stat() results are accounted for in bulk with numpy
+# (see account_stats()), smaller ones aren't worth the setup and go entry by entry
+VECTOR_MIN = 32
+
+# st_modes key for each non-directory file type, by (st_mode & S_IFMT) >> 12
+FILE_TYPES = [(stat.S_IFREG >> 12, 'reg'), (stat.S_IFLNK >> 12, 'link'), (stat.S_IFBLK >> 12, 'block'),
+              (stat.S_IFCHR >> 12, 'char'), (stat.S_IFIFO >> 12, 'fifo'), (stat.S_IFSOCK >> 12, 'sock')]
+
+# '--scan-threads': longest the main thread sleeps before checking on its scanners and the Manager
+SCAN_WAKEUP = 0.05
+
+# a frontier item starting with this marker is a chunk of names from a split directory
+# rather than a directory path - paths can never contain NUL
+SPLIT_MARK = '\0'
+
+
+
+################################################################################
+def make_split_chunk(dirname, names):
+    # '\0<count>/<name>/<name>/.../<dirname>' - names cannot contain '/', so
+    # the count tells us where the names end and the directory begins
+    return '{}{}/{}/{}'.format(SPLIT_MARK, len(names), '/'.join(names), dirname)
+
+def parse_split_chunk(item):
+    count, rest = item[len(SPLIT_MARK):].split('/', 1)
+    parts = rest.split('/', int(count))
+    return parts[-1], parts[:-1]
+
+def lstat_entry(pathname):
+    # os.lstat(), handing back rather than raising any error so one bad entry doesn't
+    # cost us the rest of its block
+    try:
+        return os.lstat(pathname)
+    except OSError as error:
+        return error
+
+def entry_kind(di, stat_files):
+    # the type of a directory entry from its d_type, no stat() needed on most filesystems.
+    # None if we should stat() it after all: regular files (and the odd fifo/socket/device,
+    # which d_type tells apart but DirEntry doesn't) under '--stat files'.
+    if di.is_dir(follow_symlinks=False): return 'dir'
+    if di.is_symlink(): return 'link'
+    if stat_files: return None
+    return 'reg' if di.is_file(follow_symlinks=False) else 'other'
+
 ################################################################################
 class BaseWorker(MPIClass):
 
+    # whether process_file() does any work, or the bulk path in account_stats() can skip it
+    has_file_hook = True
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    def __init__(self):
-        MPIClass.__init__(self)
+    def __init__(self, options=None):
+        MPIClass.__init__(self,options)
 
+        self.dirs = []
+        self.dir_costs = [] # <--- estimated subtree cost of each of self.dirs, for --frontier priority
+        self.split_dir_parts = defaultdict(DirTally) # <--- our share of directories split across ranks
         self.queue = None
+        self.engine = None
+        self.idle_time = 0.
+        self.nwaits = 0
+
+        # when to ship discovered directories / report progress, see adapt_thresholds()
+        self.maxdirs = MAXDIRS_BEFORE_SEND
+        self.progress_increment = PROGRESS_INCREMENT
+        self.scan_rate = 0.
+        self.rate_mark = (MPI.Wtime(), 0., 0)
+
+        # --scan-threads: several directories in flight at once, each on its own thread.  they
+        # share our counters and heaps under self.lock, and leave all messaging to the main thread
+        self.scanners = []
+        self.lock = threading.RLock() if self.options.scan_threads > 0 else nullcontext()
+        self.bucket_lock = threading.Lock() if self.options.scan_threads > 0 else nullcontext()
+
+        # --stat-threads: stat() calls release the GIL, so a pool of threads keeps that many
+        # in flight while we account for the results in order, here on the main thread
+        self.stat_pool = None
+        if self.i_scan and self.options.stat_threads > 0:
+            self.stat_pool = ThreadPoolExecutor(max_workers=self.options.stat_threads)
+
+        # --stat-rate: our share of the target, in stat()s per second
+        if self.i_scan and (self.options.stat_rate or self.options.stat_rate_file):
+            self.bucket = TokenBucket(self.options.stat_rate / self.rate_divisor,
+                                      on_wait=self.poll_throttle)
         return
 
 
@@ -25,111 +125,374 @@ class BaseWorker(MPIClass):
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def process_directory(self, dirname):
 
-        self.dirs = []
-
         # last-minute check for a race condition:
         if not os.path.exists(dirname):
             print('[{:3d}] directory \'{}\' vanished'.format(self.rank, dirname), file=sys.stderr)
             return
 
-        self.num_dirs += 1
-        self.st_modes['dir'] += 1
+        with self.lock:
+            self.num_dirs += 1
+            self.st_modes['dir'] += 1
 
         #print('[{:3d}](d) {}'.format(self.rank, dirname))
 
         try:
-            thisdir_nitems = 0
-            thisdir_nbytes = 0
-            thisdir_max_mtime = -1
-            thisdir_max_ctime = -1
-            thisdir_max_atime = -1
+            thisdir = DirTally()
+            # (nothing to gain splitting a directory if we aren't going to stat() it)
+            split = self.options.split_threshold if 'none' != self.options.stat else 0
+            nread = 0
+
+            with os.scandir(dirname) as entries:
+                while True:
+
+                    # huge directory: fan the stat()s of everything we have not seen yet out
+                    # to other ranks, and keep only our part of it for now
+                    if split and nread == split and self.split_directory(dirname, entries):
+                        with self.lock: self.split_dir_parts[dirname].merge(thisdir)
+                        break
+
+                    # next block of names, stopping short at the split threshold
+                    count = min(STAT_BLOCK, split - nread) if nread < split else STAT_BLOCK
+                    block = list(islice(entries, count))
+                    if not block:
+                        # track the size & count of this directory in our top heaps,
+                        # and bin its files into our histograms
+                        with self.lock:
+                            self.add_dir_entry(thisdir.entry(dirname))
+                            self.histograms.flush()
+                        break
+                    nread += len(block)
+
+                    self.scan_block(block, thisdir)
+
+
+        except Exception as error:
+            print('[{:3d}] Cannot scan: {}'.format(self.rank, error), file=sys.stderr)
+            #print('cannot scan {}'.format(dirname), file=sys.stderr)
+
+        # if present, wait for our work queue to drain.
+        # note that since each rank is wholly responsible for a given directory,
+        # and our queue is populated by item count, we have not accounted yet for
+        # different item sizes and their impact on queue processing time.  By
+        # waiting here for our queue to drain we can more effectively load balance,
+        # rather than filling up the queue with items that may take a long time to
+        # process later.
+        if self.queue: self.queue.join()
+
+        return
 
-            dirdepth = dirname.count(os.path.sep)
 
-            for di in os.scandir(dirname):
 
-                pathname = di.path
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def scan_block(self, block, thisdir):
+        # stat() the entries --stat asks for, and take everything else from the directory entries
+        block = self.select_entries(block)
+        if not block: return
+        paths = [di.path for di in block]
+        if 'all' == self.options.stat:
+            self.account_block(paths, self.stat_block(paths), thisdir)
+            return
+
+        kinds = [entry_kind(di, 'files' == self.options.stat) for di in block]
+        stats = [None]*len(paths)
+        wanted = [i for i, kind in enumerate(kinds) if kind is None]
+        if wanted:
+            for i, statinfo in zip(wanted, self.stat_block([paths[i] for i in wanted])):
+                stats[i] = statinfo
+        self.account_block(paths, stats, thisdir, kinds)
+        return
+
 
-                statinfo = di.stat(follow_symlinks=False)
 
-                thisdir_nitems += 1
-                thisdir_nbytes += statinfo.st_size
-                self.num_items += 1
-                self.total_size += statinfo.st_size
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def select_entries(self, entries):
+        # drop whatever --exclude / --include rule out, before anything gets stat()ed or queued
+        if not self.options.filter: return entries
+        kept = self.options.filter.select(entries)
+        if len(kept) != len(entries):
+            with self.lock: self.num_pruned += len(entries) - len(kept)
+        return kept
+
 
-                self.uids[statinfo.st_uid].set_id(statinfo.st_uid)
-                self.uids[statinfo.st_uid].nitems += 1
-                self.uids[statinfo.st_uid].nbytes += statinfo.st_size
 
-                self.gids[statinfo.st_gid].set_id(statinfo.st_gid)
-                self.gids[statinfo.st_gid].nitems += 1
-                self.gids[statinfo.st_gid].nbytes += statinfo.st_size
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def stat_block(self, paths):
+        # lstat() a block of paths, results in the same order - overlapped across our
+        # pool with --stat-threads
+        if self.bucket:
+            with self.bucket_lock: self.bucket.take(len(paths))
+        if self.stat_pool: return list(self.stat_pool.map(lstat_entry, paths))
+        return [lstat_entry(pathname) for pathname in paths]
 
-                # send a progress update periodically
-                # (in production we have many directories with 1M+ files, this ensures some progress is
-                # detected and reported by Manager even for huge dirs)
-                if 0 == thisdir_nitems%PROGRESS_INCREMENT:
-                    self.report_progress()
 
-                # decode file type
-                fmode = statinfo.st_mode
 
-                if stat.S_ISDIR(fmode):
-                    self.dirs.append(pathname)
-                    if len(self.dirs) == MAXDIRS_BEFORE_SEND: self.send_my_dirlist()
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def account_block(self, paths, stats, thisdir, kinds=None):
+        # fold a block of results into our counters, in directory order whichever
+        # thread stat()ed them.  entries we did not stat() come with their 'kinds' instead.
+        with self.lock:
+            stat_paths = []
+            stat_infos = []
+            for i, (pathname, statinfo) in enumerate(zip(paths, stats)):
+                if statinfo is None:
+                    self.process_kind(pathname, kinds[i], thisdir)
+                elif isinstance(statinfo, OSError):
+                    print('[{:3d}] Cannot stat: {}'.format(self.rank, statinfo), file=sys.stderr)
                 else:
-                    self.num_files += 1
+                    stat_paths.append(pathname)
+                    stat_infos.append(statinfo)
+
+            if len(stat_infos) >= VECTOR_MIN:
+                self.account_stats(stat_paths, stat_infos, thisdir)
+            else:
+                for pathname, statinfo in zip(stat_paths, stat_infos):
+                    self.process_entry(pathname, statinfo, thisdir)
+        return
 
-                    if   stat.S_ISREG(fmode):  self.st_modes['reg']   += 1
-                    elif stat.S_ISLNK(fmode):  self.st_modes['link']  += 1
-                    elif stat.S_ISBLK(fmode):  self.st_modes['block'] += 1
-                    elif stat.S_ISCHR(fmode):  self.st_modes['char']  += 1
-                    elif stat.S_ISFIFO(fmode): self.st_modes['fifo']  += 1
-                    elif stat.S_ISSOCK(fmode): self.st_modes['sock']  += 1
 
-                    # track the *maximum mtime/ctime/atime for this directories contents (not the dir itself though)
-                    thisdir_max_mtime = max(thisdir_max_mtime, statinfo.st_mtime)
-                    thisdir_max_ctime = max(thisdir_max_ctime, statinfo.st_ctime)
-                    thisdir_max_atime = max(thisdir_max_atime, statinfo.st_atime)
 
-                    fe = FileEntry(pathname, statinfo.st_size,
-                                   statinfo.st_mtime, statinfo.st_ctime, statinfo.st_atime)
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def tally_ids(self, tallies, ids, sizes, allocs):
+        # per-owner item & byte counts for a block, one dict update per distinct id
+        uniq, inverse = np.unique(ids, return_inverse=True)
+        nitems, nbytes, nalloc = bin_sums(inverse, len(uniq), sizes, allocs)
+        for id, n, b, a in zip(uniq.tolist(), nitems.tolist(), nbytes.tolist(), nalloc.tolist()):
+            tallies[id].nitems += n
+            tallies[id].nbytes += b
+            tallies[id].nalloc += a
+        return
 
-                    # track the size & count of this file in our top heap
-                    self.top_nbytes_files.add((statinfo.st_size, fe))
 
-                    # --------------------------------------------------------------------------
-                    # additional file processing - simply a placeholder stub for derived classes
-                    # to do additional work on this file.
-                    self.process_file(pathname, statinfo)
-                    #------------------------------------
 
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def account_stats(self, paths, stats, thisdir):
+        # same as process_entry() over a whole block, but with the stat fields gathered into
+        # arrays and reduced in bulk.  only directories found and the top-files heap still
+        # take a step per entry.
+        n = len(stats)
+        sizes = np.fromiter(map(attrgetter('st_size'), stats), np.int64, n)
+        modes = np.fromiter(map(attrgetter('st_mode'), stats), np.int64, n)
+        uids  = np.fromiter(map(attrgetter('st_uid'),  stats), np.int64, n)
+        gids  = np.fromiter(map(attrgetter('st_gid'),  stats), np.int64, n)
+        allocs = 512*np.fromiter(map(attrgetter('st_blocks'), stats), np.int64, n)
+
+        nbytes = int(sizes.sum())
+        nalloc = int(allocs.sum())
+        first = thisdir.nitems
+        thisdir.nitems += n
+        thisdir.nbytes += nbytes
+        thisdir.nalloc += nalloc
+        self.num_items += n
+        self.total_size += nbytes
+        self.total_alloc += nalloc
+
+        self.tally_ids(self.uids, uids, sizes, allocs)
+        self.tally_ids(self.gids, gids, sizes, allocs)
+
+        # send a progress update whenever we pass another multiple of progress_increment
+        if first // self.progress_increment != thisdir.nitems // self.progress_increment:
+            self.report_progress()
+
+        ftypes = (modes & 0o170000) >> 12 # <--- stat.S_IFMT(), shifted down to 0..15
+        isdir = (ftypes == stat.S_IFDIR >> 12)
+
+        for i in np.flatnonzero(isdir).tolist():
+            pathname = paths[i]
+            self.dirs.append(pathname)
+            if self.ship_costs: self.dir_costs.append(subtree_cost(stats[i], first+i+1, pathname.count(os.path.sep)))
+        if len(self.dirs) >= self.maxdirs: self.send_my_dirlist()
+
+        files = np.flatnonzero(~isdir)
+        if not len(files): return
+        self.num_files += len(files)
+
+        ntypes = np.bincount(ftypes[files], minlength=16).tolist()
+        for ftype, name in FILE_TYPES:
+            if ntypes[ftype]: self.st_modes[name] += ntypes[ftype]
+
+        # track the *maximum mtime/ctime/atime for this directories contents (not the dir itself though)
+        mtimes = np.fromiter(map(attrgetter('st_mtime'), stats), np.float64, n)
+        ctimes = np.fromiter(map(attrgetter('st_ctime'), stats), np.float64, n)
+        atimes = np.fromiter(map(attrgetter('st_atime'), stats), np.float64, n)
+        thisdir.max_mtime = max(thisdir.max_mtime, float(mtimes[files].max()))
+        thisdir.max_ctime = max(thisdir.max_ctime, float(ctimes[files].max()))
+        thisdir.max_atime = max(thisdir.max_atime, float(atimes[files].max()))
+        self.histograms.add(sizes[files], uids[files], gids[files], mtimes[files], atimes[files])
+
+        # files with more hard links than this one, to be counted once in the end
+        nlinks = np.fromiter(map(attrgetter('st_nlink'), stats), np.int64, n)
+        linked = files[nlinks[files] > 1]
+        if len(linked):
+            self.hardlinks.add(np.array([stats[i].st_dev for i in linked.tolist()], dtype=np.int64),
+                               np.array([stats[i].st_ino for i in linked.tolist()], dtype=np.int64),
+                               sizes[linked], uids[linked], gids[linked])
+
+        # only files that can still make our top list go in, straight from the arrays
+        threshold = self.top_nbytes_files.threshold()
+        candidates = files if threshold is None else files[sizes[files] >= threshold]
+        if len(candidates):
+            self.top_nbytes_files.add_arrays(sizes[candidates], [paths[i] for i in candidates.tolist()],
+                                             nbytes=sizes[candidates], nalloc=allocs[candidates], mtime=mtimes[candidates],
+                                             ctime=ctimes[candidates], atime=atimes[candidates])
+
+        # and the same for the most over-allocated and the most sparse files
+        for heap, excess in ((self.top_overalloc_files, allocs - sizes), (self.top_sparse_files, sizes - allocs)):
+            threshold = heap.threshold()
+            keep = excess[files] > 0
+            if threshold is not None: keep &= excess[files] >= threshold
+            candidates = files[keep]
+            if len(candidates):
+                heap.add_arrays(excess[candidates], [paths[i] for i in candidates.tolist()],
+                                nbytes=sizes[candidates], nalloc=allocs[candidates], mtime=mtimes[candidates],
+                                ctime=ctimes[candidates], atime=atimes[candidates])
+
+        if self.has_file_hook:
+            for i in files.tolist():
+                self.process_file(paths[i], stats[i])
+        return
 
-            # track the size & count of this directory in our top heaps
-            de = DirEntry(dirname, thisdir_nbytes, thisdir_nitems,
-                          thisdir_max_mtime, thisdir_max_ctime, thisdir_max_atime)
 
-            self.top_nitems_dirs.add((thisdir_nitems, de))
-            self.top_nbytes_dirs.add((thisdir_nbytes, de))
 
-            if thisdir_nitems >= self.options.threshold_count or thisdir_nbytes >= self.options.threshold_size:
-                if thisdir_max_mtime > 0: self.oldest_mtime_dirs.add((-thisdir_max_mtime, de)) # (-) to turn maxheap into a minheap
-                if thisdir_max_atime > 0: self.oldest_atime_dirs.add((-thisdir_max_atime, de)) # (-) to turn maxheap into a minheap
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def process_entry(self, pathname, statinfo, thisdir):
+
+        nalloc = 512*statinfo.st_blocks
+        thisdir.nitems += 1
+        thisdir.nbytes += statinfo.st_size
+        thisdir.nalloc += nalloc
+        self.num_items += 1
+        self.total_size += statinfo.st_size
+        self.total_alloc += nalloc
+
+        self.uids[statinfo.st_uid].nitems += 1
+        self.uids[statinfo.st_uid].nbytes += statinfo.st_size
+        self.uids[statinfo.st_uid].nalloc += nalloc
+
+        self.gids[statinfo.st_gid].nitems += 1
+        self.gids[statinfo.st_gid].nbytes += statinfo.st_size
+        self.gids[statinfo.st_gid].nalloc += nalloc
+
+        # send a progress update periodically
+        # (in production we have many directories with 1M+ files, this ensures some progress is
+        # detected and reported by Manager even for huge dirs)
+        if 0 == thisdir.nitems%self.progress_increment:
+            self.report_progress()
+
+        # decode file type
+        fmode = statinfo.st_mode
+
+        if stat.S_ISDIR(fmode):
+            self.dirs.append(pathname)
+            if self.ship_costs: self.dir_costs.append(subtree_cost(statinfo, thisdir.nitems, pathname.count(os.path.sep)))
+            if len(self.dirs) >= self.maxdirs: self.send_my_dirlist()
+        else:
+            self.num_files += 1
+
+            if   stat.S_ISREG(fmode):  self.st_modes['reg']   += 1
+            elif stat.S_ISLNK(fmode):  self.st_modes['link']  += 1
+            elif stat.S_ISBLK(fmode):  self.st_modes['block'] += 1
+            elif stat.S_ISCHR(fmode):  self.st_modes['char']  += 1
+            elif stat.S_ISFIFO(fmode): self.st_modes['fifo']  += 1
+            elif stat.S_ISSOCK(fmode): self.st_modes['sock']  += 1
+
+            # track the *maximum mtime/ctime/atime for this directories contents (not the dir itself though)
+            thisdir.max_mtime = max(thisdir.max_mtime, statinfo.st_mtime)
+            thisdir.max_ctime = max(thisdir.max_ctime, statinfo.st_ctime)
+            thisdir.max_atime = max(thisdir.max_atime, statinfo.st_atime)
+            self.histograms.add_file(statinfo.st_size, statinfo.st_uid, statinfo.st_gid,
+                                     statinfo.st_mtime, statinfo.st_atime)
+            if statinfo.st_nlink > 1:
+                self.hardlinks.add_file(statinfo.st_dev, statinfo.st_ino, statinfo.st_size,
+                                        statinfo.st_uid, statinfo.st_gid)
+
+            # track the size & count of this file in our top heap - if it can still get in
+            threshold = self.top_nbytes_files.threshold()
+            if threshold is None or statinfo.st_size >= threshold:
+                fe = FileEntry(pathname, statinfo.st_size, nalloc,
+                               statinfo.st_mtime, statinfo.st_ctime, statinfo.st_atime)
+                self.top_nbytes_files.add((statinfo.st_size, fe))
+
+            # and in the most over-allocated / most sparse ones
+            for heap, excess in ((self.top_overalloc_files, nalloc - statinfo.st_size), (self.top_sparse_files, statinfo.st_size - nalloc)):
+                threshold = heap.threshold()
+                if excess > 0 and (threshold is None or excess >= threshold):
+                    heap.add((excess, FileEntry(pathname, statinfo.st_size, nalloc,
+                                                statinfo.st_mtime, statinfo.st_ctime, statinfo.st_atime)))
+
+            # --------------------------------------------------------------------------
+            # additional file processing - simply a placeholder stub for derived classes
+            # to do additional work on this file.
+            self.process_file(pathname, statinfo)
+            #------------------------------------
+        return
 
 
-        except Exception as error:
-            print('[{:3d}] Cannot scan: {}'.format(self.rank, error), file=sys.stderr)
-            #print('cannot scan {}'.format(dirname), file=sys.stderr)
 
-        # if present, wait for our work queue to drain.
-        # note that since each rank is wholly responsible for a given directory,
-        # and our queue is populated by item count, we have not accounted yet for
-        # different item sizes and their impact on queue processing time.  By
-        # waiting here for our queue to drain we can more effectively load balance,
-        # rather than filling up the queue with items that may take a long time to
-        # process later.
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def process_kind(self, pathname, kind, thisdir):
+        # counterpart to process_entry() for an entry we know only the type of (--stat):
+        # it counts, and directories are queued, but no sizes, owners or times
+        thisdir.nitems += 1
+        self.num_items += 1
+
+        if 0 == thisdir.nitems%self.progress_increment:
+            self.report_progress()
+
+        if 'dir' == kind:
+            self.dirs.append(pathname)
+            if self.ship_costs: self.dir_costs.append(0)
+            if len(self.dirs) >= self.maxdirs: self.send_my_dirlist()
+        else:
+            self.num_files += 1
+            self.st_modes[kind] += 1
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split_directory(self, dirname, entries):
+        # read the remaining names only (cheap, no stat), and hand them out in chunks
+        # through the frontier like any other directory.  the parts are put back together
+        # in summary(), see MPIClass.merge_split_dirs().
+        names = [di.name for di in self.select_entries(list(entries))]
+        if not names: return False
+        chunk = self.options.split_chunk or self.options.split_threshold
+        with self.lock:
+            for start in range(0, len(names), chunk):
+                self.dirs.append(make_split_chunk(dirname, names[start:start+chunk]))
+                if self.ship_costs: self.dir_costs.append(len(names[start:start+chunk]))
+            self.nsplit += 1
+        # get the chunks moving right away
+        self.send_my_dirlist()
+        return True
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def process_split_chunk(self, item):
+
+        dirname, names = parse_split_chunk(item)
+        thisdir = DirTally()
+
+        for start in range(0, len(names), STAT_BLOCK):
+            paths = [os.path.join(dirname, name) for name in names[start:start+STAT_BLOCK]]
+            self.account_block(paths, self.stat_block(paths), thisdir)
+
+        with self.lock: self.split_dir_parts[dirname].merge(thisdir)
+
         if self.queue: self.queue.join()
+        return
+
+
 
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def process_item(self, item):
+        self.poll_throttle()
+        # a frontier item is either a directory or a chunk of a split directory
+        if item.startswith(SPLIT_MARK):
+            self.process_split_chunk(item)
+        else:
+            self.process_directory(item)
         return
 
 
@@ -142,30 +505,152 @@ class BaseWorker(MPIClass):
 
 
 
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def counts(self):
+        # our running totals, which ride along on every message to the Manager.
+        # with --progress-rma the Manager reads them from its window instead, so
+        # keep that current whenever we would have told it.
+        if self.progress_win: self.publish_progress()
+        return [self.num_items, self.total_size]
+
+
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def send_my_dirlist(self):
+        if self.on_scanner_thread(): return
+
+        # the work-stealing engine keeps what we find in its own rank-local queue
+        if self.engine:
+            self.engine.queue.extend(self.dirs)
+            self.dirs = []
+            self.dir_costs = []
+            return
+
         # option 1: send dirs in batch
         if self.dirs:
-            self.maxnumdirs = max(self.maxnumdirs, len(self.dirs))
-            # abuse self.dirs - append our current counts, this allows manager
-            # to summarize collective progress while only sending a single message
-            self.dirs.append(self.num_items)
-            self.dirs.append(self.total_size)
-            self.comm.send(self.dirs, dest=0, tag=self.tags['dir_reply'])
-            self.dirs = []
+            with self.lock:
+                dirs, costs = self.dirs, self.dir_costs
+                self.dirs = []
+                self.dir_costs = []
+            self.maxnumdirs = max(self.maxnumdirs, len(dirs))
+            # include our current counts, this allows manager to summarize
+            # collective progress while only sending a single message
+            self.send_dirs(self.manager_rank, self.tags['dir_reply'], dirs, self.counts(), costs)
+            self.ndirs_sent += len(dirs)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def on_scanner_thread(self):
+        # --scan-threads: only the main thread sends or receives, see run_threaded()
+        return self.scanners and threading.current_thread() is not threading.main_thread()
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def set_throttle(self, rate):
+        # a new --stat-rate target from the Manager, of which we take our share
+        self.bucket.set_rate(rate / self.rate_divisor)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def poll_throttle(self):
+        # pick up any new --stat-rate target (only the Manager engine adjusts it mid-run)
+        if not self.bucket or self.engine or self.on_scanner_thread(): return
+        status = MPI.Status()
+        while self.comm.iprobe(source=0, tag=self.tags['throttle'], status=status):
+            _, counts, _ = self.recv_dirs(source=0, tag=self.tags['throttle'], status=status)
+            self.set_throttle(counts[0])
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def recv_instructions(self, status):
+        # block on our next 'execute' or 'terminate', from any source ('terminate' may be
+        # forwarded by a peer, see forward_terminate()), applying new --stat-rate targets
+        # that arrive in the meantime
+        while True:
+            next_dirs, counts, _ = self.recv_dirs(status=status)
+            if status.Get_tag() != self.tags['throttle']: return next_dirs, counts
+            self.set_throttle(counts[0])
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def adapt_thresholds(self, backlog):
+        # '--send-policy adaptive', on every assignment: 'backlog' is how many directories our
+        # Manager still has queued for each worker.  A starving Manager gets what we find in
+        # small batches right away, one with plenty to hand out gets fewer, larger batches.
+        if 'adaptive' != self.options.send_policy: return
+        self.maxdirs = max(MIN_DIRS_BEFORE_SEND, min(MAX_DIRS_BEFORE_SEND, backlog))
+
+        # our scan rate while busy (not waiting on assignments) since last time, smoothed,
+        # so that progress goes out about once per reporting interval however fast we stat()
+        curtime = MPI.Wtime()
+        mark_time, mark_idle, mark_items = self.rate_mark
+        busy = (curtime - mark_time) - (self.idle_time - mark_idle)
+        if busy > 0.1:
+            rate = (self.num_items - mark_items) / busy
+            self.scan_rate = 0.5*(self.scan_rate + rate) if self.scan_rate else rate
+            self.rate_mark = (curtime, self.idle_time, self.num_items)
+            if self.options.progress > 0:
+                self.progress_increment = int(max(MIN_PROGRESS_INCREMENT,
+                                                  min(MAX_PROGRESS_INCREMENT, self.scan_rate*self.options.progress)))
         return
 
 
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def report_progress(self):
-        self.comm.send([self.num_items, self.total_size], dest=0, tag=self.tags['progress'])
+        if self.on_scanner_thread(): return
+        self.poll_throttle()
+
+        # no Manager to report to, but answer any thieves while we are busy
+        if self.engine:
+            self.engine.poll()
+            return
+
+        if self.progress_win:
+            self.publish_progress()
+            return
+
+        # our directories carry our counts too, so when adapting send them instead and
+        # save the Manager a message
+        if self.dirs and 'adaptive' == self.options.send_policy:
+            self.send_my_dirlist()
+            return
+
+        self.send_dirs(self.manager_rank, self.tags['progress'], counts=self.counts())
         return
 
 
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def run(self):
+
+        # decentralized walk, no Manager involved
+        if 'steal' == self.options.engine:
+            self.engine = StealEngine(self)
+            self.engine.run()
+            return
+
+        # in two-level mode, this rank serves the other workers on its node instead
+        if self.i_am_submanager:
+            SubManager(self).run()
+            return
+
+        if self.options.scan_threads > 0:
+            self.run_threaded()
+            return
+
+        if self.options.prefetch:
+            self.run_prefetch()
+            return
+
         self.comm.Barrier()
         status = MPI.Status()
         while True:
@@ -174,19 +659,189 @@ class BaseWorker(MPIClass):
             self.send_my_dirlist()
 
             # # receive instructions from Manager
-            next_dir = self.comm.sendrecv([self.num_items, self.total_size],
-                                          dest=0,  sendtag=self.tags['ready'],
-                                          source=0, recvtag=MPI.ANY_TAG,
-                                          status=status)
+            wait_start = MPI.Wtime()
+            self.send_dirs(self.manager_rank, self.tags['ready'], counts=self.counts())
+            next_dirs, counts = self.recv_instructions(status)
+            self.idle_time += MPI.Wtime() - wait_start
+            self.nwaits += 1
 
             if status.Get_tag() == self.tags['terminate']:
-                assert (next_dir == None)
+                self.forward_terminate(counts)
+                self.poll_throttle()
                 break
 
-            if next_dir:
-                assert (status.Get_tag() == self.tags['execute'])
-                self.process_directory(next_dir)
+            # consume the whole batch before reporting ready again.
+            # any directories we discover along the way accumulate in self.dirs
+            # and are shipped to the Manager as they reach self.maxdirs,
+            # or at the top of the loop above.
+            assert (status.Get_tag() == self.tags['execute'])
+            self.adapt_thresholds(counts[0])
+            if next_dirs:
+                for next_dir in next_dirs:
+                    self.process_item(next_dir)
 
         #print('[{:3d}] *** Finished, maximum # of dirs at once: {}'.format(self.rank,
         #                                                                   format_number(self.maxnumdirs)))
         return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run_prefetch(self):
+
+        # --prefetch N: keep up to N assigned directories in a local queue, and top it up
+        # with a non-committal 'dir_request' while we are still busy scanning, so the
+        # Manager round trip overlaps our own work.  a 'dir_request' is always answered
+        # right away, possibly empty handed.  only once our queue is empty and nothing
+        # is outstanding do we report 'ready' and block, exactly as without prefetch.
+        # at most one request is ever outstanding, so any message from our Manager
+        # answers the one we are waiting on.
+        self.comm.Barrier()
+        status = MPI.Status()
+        local = deque()
+        requested = False
+        denied = False  # <--- last request came back empty, don't ask again until we run dry
+
+        while True:
+
+            # send our dir list to manager (if any)
+            self.send_my_dirlist()
+
+            # pick up the answer to an outstanding request, blocking only if we have nothing else to do
+            if requested and (not local or self.comm.iprobe(source=self.manager_rank, tag=self.tags['execute'])):
+                wait_start = MPI.Wtime()
+                next_dirs, counts, _ = self.recv_dirs(source=self.manager_rank, tag=self.tags['execute'], status=status)
+                self.adapt_thresholds(counts[0])
+                if not local:
+                    self.idle_time += MPI.Wtime() - wait_start
+                    self.nwaits += 1
+                requested = False
+                denied = not next_dirs
+                local.extend(next_dirs)
+
+            if not local:
+                # out of work: report ready and block on the Manager, as usual
+                wait_start = MPI.Wtime()
+                self.send_dirs(self.manager_rank, self.tags['ready'], counts=self.counts())
+                next_dirs, counts = self.recv_instructions(status)
+                self.idle_time += MPI.Wtime() - wait_start
+                self.nwaits += 1
+
+                if status.Get_tag() == self.tags['terminate']:
+                    self.forward_terminate(counts)
+                    self.poll_throttle()
+                    break
+
+                self.adapt_thresholds(counts[0])
+                denied = False
+                local.extend(next_dirs)
+                continue
+
+            next_dir = local.popleft()
+
+            # running low - ask for more before starting on this one
+            if not requested and not denied and len(local) < self.options.prefetch:
+                self.send_dirs(self.manager_rank, self.tags['dir_request'], counts=self.counts())
+                requested = True
+
+            self.process_item(next_dir)
+
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def scan_loop(self, work):
+        # --scan-threads: one of our scanners, working through directories from 'work'
+        # until it hands us None
+        while True:
+            item = work.get()
+            if item is None: break
+            self.process_item(item)
+            with self.lock: self.npending -= 1
+            self.wakeup.set()
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run_threaded(self):
+
+        # --scan-threads N: N scanner threads pull directories from a rank-local queue, so a
+        # single slow scandir() (a hung NFS export, say) does not hold up the whole rank.
+        # this (main) thread does all the talking to the Manager, much as in run_prefetch():
+        # it keeps the queue topped up with non-committal 'dir_request's, ships what the
+        # scanners find, reports progress, and only reports 'ready' once every scanner is idle.
+        self.comm.Barrier()
+        status = MPI.Status()
+        work = queue.Queue()
+        self.npending = 0  # <--- directories queued or being scanned
+        self.wakeup = threading.Event()
+        self.scanners = [threading.Thread(target=self.scan_loop, args=(work,), daemon=True)
+                         for t in range(self.options.scan_threads)]
+        for t in self.scanners: t.start()
+
+        depth = self.options.scan_threads + self.options.prefetch
+        requested = False
+        denied = False  # <--- last request came back empty, don't ask again until we run dry
+        reported = 0
+
+        def assign(next_dirs):
+            with self.lock: self.npending += len(next_dirs)
+            for next_dir in next_dirs: work.put(next_dir)
+
+        while True:
+            self.wakeup.clear()
+
+            # send our dir list to manager (if any)
+            self.send_my_dirlist()
+
+            # pick up the answer to an outstanding request, without blocking while scanners are busy
+            with self.lock: idle = (0 == self.npending and not self.dirs)
+            if requested and (idle or self.comm.iprobe(source=self.manager_rank, tag=self.tags['execute'])):
+                wait_start = MPI.Wtime()
+                next_dirs, counts, _ = self.recv_dirs(source=self.manager_rank, tag=self.tags['execute'], status=status)
+                if idle:
+                    self.idle_time += MPI.Wtime() - wait_start
+                    self.nwaits += 1
+                self.adapt_thresholds(counts[0])
+                requested = False
+                denied = not next_dirs
+                assign(next_dirs)
+                continue
+
+            if idle:
+                # out of work: report ready and block on the Manager, as usual
+                wait_start = MPI.Wtime()
+                self.send_dirs(self.manager_rank, self.tags['ready'], counts=self.counts())
+                next_dirs, counts = self.recv_instructions(status)
+                self.idle_time += MPI.Wtime() - wait_start
+                self.nwaits += 1
+
+                if status.Get_tag() == self.tags['terminate']:
+                    self.forward_terminate(counts)
+                    self.poll_throttle()
+                    break
+
+                self.adapt_thresholds(counts[0])
+                denied = False
+                assign(next_dirs)
+                continue
+
+            # running low - ask for more while our scanners are still busy
+            if not requested and not denied and self.npending < depth:
+                self.send_dirs(self.manager_rank, self.tags['dir_request'], counts=self.counts())
+                requested = True
+
+            # progress on behalf of our scanners, which cannot send it themselves
+            if self.num_items - reported >= self.progress_increment:
+                reported = self.num_items
+                self.report_progress()
+            else:
+                self.poll_throttle()
+
+            self.wakeup.wait(SCAN_WAKEUP)
+
+        for t in self.scanners: work.put(None)
+        for t in self.scanners: t.join()
+        return
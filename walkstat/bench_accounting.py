@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for per-directory accounting: BaseWorker.process_entry(), one entry at a
+# time, against BaseWorker.account_stats(), a block at a time with numpy.  Every entry is
+# stat()ed once up front so only the accounting itself is timed.
+#
+#   ./bench_accounting.py [--entries 1000000] [--dir /path/to/big/dir]
+#
+# Without --dir, a scratch directory of small files is created (and removed afterwards).
+
+import argparse
+import io
+import os, sys
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+
+
+################################################################################
+def make_worker(dirname):
+    # a StatWorker with default walkstat options, as if started on 'dirname'
+    from parse_args import parse_options
+    from stat_worker import StatWorker
+    argv = sys.argv
+    sys.argv = [argv[0], '-d', dirname]
+    with redirect_stdout(io.StringIO()):
+        options = parse_options('walkstat')
+    sys.argv = argv
+    worker = StatWorker(options)
+    worker.progress_increment = sys.maxsize # <--- nobody to report to
+    return worker
+
+
+
+################################################################################
+def make_directory(nentries):
+    dirname = tempfile.mkdtemp(prefix='bench_accounting.', dir=os.environ.get('TMPDIR'))
+    for i in range(nentries):
+        with open(os.path.join(dirname, 'f{:07d}'.format(i)), 'wb') as f:
+            if i % 7: f.write(b'x' * (i % 4096))
+    return dirname
+
+
+
+################################################################################
+def summarize(worker, thisdir):
+    # everything the two methods must agree on
+    worker.histograms.flush()
+    return (worker.num_items, worker.num_files, worker.total_size, worker.total_alloc, dict(worker.st_modes),
+            sorted((k, v.nitems, v.nbytes, v.nalloc) for k,v in worker.uids.items()),
+            sorted((k, v.nitems, v.nbytes, v.nalloc) for k,v in worker.gids.items()),
+            sorted((k, row.tolist()) for k,row in worker.histograms.uids.items()),
+            sorted((k, row.tolist()) for k,row in worker.histograms.gids.items()),
+            thisdir.entry(''), worker.top_nbytes_files.top(),
+            worker.top_overalloc_files.top(), worker.top_sparse_files.top())
+
+
+
+################################################################################
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time per-entry vs. numpy accounting of one directory')
+    parser.add_argument('--entries', default=1000000, type=int, help='Entries in the scratch directory (default: 1,000,000)')
+    parser.add_argument('--dir', default=None, help='Existing directory to use instead of a scratch one')
+    parser.add_argument('--repeat', default=3, type=int, help='Best of this many runs (default: 3)')
+    args = parser.parse_args()
+
+    dirname = args.dir
+    if not dirname:
+        print('Creating {:,} entries...'.format(args.entries))
+        dirname = make_directory(args.entries)
+
+    try:
+        from base_worker import STAT_BLOCK
+        from mpiclass import DirTally
+        paths = [di.path for di in os.scandir(dirname)]
+        stats = [os.lstat(p) for p in paths]
+        blocks = [(paths[i:i+STAT_BLOCK], stats[i:i+STAT_BLOCK]) for i in range(0, len(paths), STAT_BLOCK)]
+        print('{}: {:,} entries, blocks of {}'.format(dirname, len(paths), STAT_BLOCK))
+
+        def per_entry(worker, thisdir):
+            for block_paths, block_stats in blocks:
+                for pathname, statinfo in zip(block_paths, block_stats):
+                    worker.process_entry(pathname, statinfo, thisdir)
+
+        def vectorized(worker, thisdir):
+            for block_paths, block_stats in blocks:
+                worker.account_stats(block_paths, block_stats, thisdir)
+
+        results = {}
+        for label, method in (('process_entry()', per_entry), ('account_stats()', vectorized)):
+            best = float('inf')
+            for r in range(args.repeat):
+                worker = make_worker(dirname)
+                thisdir = DirTally()
+                start = time.perf_counter()
+                method(worker, thisdir)
+                best = min(best, time.perf_counter() - start)
+            results[label] = (best, summarize(worker, thisdir))
+            print('  {:16s}: {:7.3f} sec, {:6.2f} usec/entry, {:12,.0f} entries/sec'.format(label, best,
+                                                                                            1.e6*best/len(paths),
+                                                                                            len(paths)/best))
+
+        (before, a), (after, b) = results.values()
+        print('  speedup         : {:.2f}x, results {}'.format(before/after, 'identical' if a == b else 'DIFFER'))
+
+    finally:
+        if not args.dir: shutil.rmtree(dirname)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the largest-files heap: building a FileEntry for every file and
+# offering it to MaxHeap.add(), against skipping files below MaxHeap.threshold() before
+# anything is built, one at a time or a block at a time with MaxHeap.add_many(), and
+# against the array-backed TopK fed a block of arrays at a time with TopK.add_arrays().
+#
+#   ./bench_topk.py [--files 1000000] [--heap-size 500] [--block 256]
+#
+# File sizes are drawn from a lognormal distribution, roughly what a home or project
+# filesystem looks like, and visited in random order.
+
+import argparse
+import time
+import numpy as np
+from maxheap import MaxHeap
+from topk import TopK
+from mpiclass import FileEntry
+
+
+
+################################################################################
+def every_file(heap, paths, sizes, times, block):
+    built = 0
+    for i in range(len(paths)):
+        fe = FileEntry(paths[i], sizes[i], sizes[i], times[i], times[i], times[i])
+        heap.add((sizes[i], fe))
+        built += 1
+    return built
+
+def gated(heap, paths, sizes, times, block):
+    built = 0
+    for i in range(len(paths)):
+        threshold = heap.threshold()
+        if threshold is None or sizes[i] >= threshold:
+            fe = FileEntry(paths[i], sizes[i], sizes[i], times[i], times[i], times[i])
+            heap.add((sizes[i], fe))
+            built += 1
+    return built
+
+def gated_blocks(heap, paths, sizes, times, block):
+    built = 0
+    size_array = np.asarray(sizes)
+    for start in range(0, len(paths), block):
+        threshold = heap.threshold()
+        candidates = np.arange(start, min(start+block, len(paths)))
+        if threshold is not None:
+            candidates = candidates[size_array[start:start+block] >= threshold]
+        heap.add_many([(sizes[i], FileEntry(paths[i], sizes[i], sizes[i], times[i], times[i], times[i]))
+                       for i in candidates.tolist()])
+        built += len(candidates)
+    return built
+
+def topk_arrays(heap, paths, sizes, times, block):
+    built = 0
+    size_array = np.asarray(sizes)
+    time_array = np.asarray(times)
+    for start in range(0, len(paths), block):
+        threshold = heap.threshold()
+        candidates = np.arange(start, min(start+block, len(paths)))
+        if threshold is not None:
+            candidates = candidates[size_array[start:start+block] >= threshold]
+        built += len(candidates) # <--- rows past the threshold, in place of FileEntry's
+        if len(candidates):
+            heap.add_arrays(size_array[candidates], [paths[i] for i in candidates.tolist()],
+                            nbytes=size_array[candidates], nalloc=size_array[candidates], mtime=time_array[candidates],
+                            ctime=time_array[candidates], atime=time_array[candidates])
+    return built
+
+
+
+################################################################################
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time top-k file heap insertion with and without threshold gating')
+    parser.add_argument('--files', default=1000000, type=int, help='Number of files (default: 1,000,000)')
+    parser.add_argument('--heap-size', default=500, type=int, help='Heap size, as walkstat --heap-size (default: 500)')
+    parser.add_argument('--block', default=256, type=int, help='Files per add_many() batch (default: 256)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    sizes = rng.lognormal(mean=10., sigma=3., size=args.files).astype(np.int64).tolist()
+    times = rng.uniform(1.e9, 1.7e9, size=args.files).tolist()
+    paths = ['/scratch/project/dir{:04d}/file{:07d}'.format(i % 1000, i) for i in range(args.files)]
+
+    results = []
+    for label, method in (('add() every file', every_file),
+                          ('threshold()+add()', gated),
+                          ('threshold()+add_many()', gated_blocks),
+                          ('TopK.add_arrays()', topk_arrays)):
+        heap = TopK(args.heap_size, FileEntry) if topk_arrays == method else MaxHeap(args.heap_size)
+        start = time.perf_counter()
+        built = method(heap, paths, sizes, times, args.block)
+        elapsed = time.perf_counter() - start
+        results.append(heap.top())
+        print('  {:22s}: {:7.3f} sec, {:6.3f} usec/file, {:>10,} FileEntry built ({:.2%})'.format(label, elapsed,
+                                                                                                 1.e6*elapsed/args.files,
+                                                                                                 built, float(built)/args.files))
+
+    print('  top {} files {}'.format(args.heap_size, 'identical' if all(r == results[0] for r in results) else 'DIFFER'))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# '--exclude' / '--include' rules, checked against directory entries before anything is
+# stat()ed - an excluded directory is never scanned, and never reaches the Manager.
+#
+# A rule is one of
+#
+#   name:NAME     an entry named exactly NAME            (name:.snapshot)
+#   glob:PATTERN  shell pattern on the entry name, or on the whole path if PATTERN has a '/'
+#   re:REGEX      regular expression searched for in the whole path
+#   path:PREFIX   the path PREFIX and everything below it, spelled the way the -d directories are
+#   PATTERN       same as glob:PATTERN
+#
+# Entries matching any --exclude rule are skipped, directories with all their contents.  With
+# --include, only files (anything but directories) matching some --include rule are counted,
+# while every directory that isn't excluded is still walked.
+#
+# Each set of rules is compiled once, on rank 0, into a name set, a name regex, a path regex
+# and a tuple of path prefixes, and goes out to every rank with the options.
+
+import os
+import re
+import fnmatch
+
+
+
+################################################################################
+class RuleSet:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, rules):
+        names = set()
+        name_patterns = []
+        path_patterns = []
+        prefixes = []
+        for rule in rules:
+            kind, sep, pattern = rule.partition(':')
+            if not sep or kind not in ('name', 'glob', 're', 'path'):
+                kind, pattern = 'glob', rule
+            if 'name' == kind:
+                names.add(pattern)
+            elif 'glob' == kind:
+                (path_patterns if os.sep in pattern else name_patterns).append(fnmatch.translate(pattern))
+            elif 're' == kind:
+                re.compile(pattern) # <--- complain about this rule in particular, if it's bad
+                path_patterns.append('(?:.*?(?:{}))'.format(pattern))
+            else:
+                prefixes.append(os.path.normpath(pattern))
+
+        self.names = frozenset(names)
+        self.name_re = re.compile('|'.join(name_patterns)) if name_patterns else None
+        self.path_re = re.compile('|'.join(path_patterns)) if path_patterns else None
+        self.prefixes = tuple(prefixes)
+        self.subtrees = tuple(p.rstrip(os.sep) + os.sep for p in prefixes)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def matches(self, name, path):
+        if name in self.names: return True
+        if self.name_re and self.name_re.match(name): return True
+        if self.path_re and self.path_re.match(path): return True
+        if self.prefixes and (path in self.prefixes or path.startswith(self.subtrees)): return True
+        return False
+
+
+
+################################################################################
+class EntryFilter:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, excludes, includes):
+        self.exclude = RuleSet(excludes) if excludes else None
+        self.include = RuleSet(includes) if includes else None
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def select(self, entries):
+        # the os.DirEntry's we want, in order.  is_dir() comes from d_type, no stat() on
+        # most filesystems.
+        kept = []
+        for di in entries:
+            if self.exclude and self.exclude.matches(di.name, di.path): continue
+            if self.include and not di.is_dir(follow_symlinks=False) and not self.include.matches(di.name, di.path): continue
+            kept.append(di)
+        return kept
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+# Frontier policies for the Manager (and sub-managers), selected with '--frontier'.
+#
+#   dfs      : plain list used LIFO - the original behavior
+#   bfs      : FIFO queue, shallowest directories first
+#   priority : max-heap keyed by an estimated subtree cost, so the largest subtrees are
+#              handed out first and the end-of-scan tail stays short
+#
+# With '--frontier-memory SIZE' the dfs frontier is kept as packed bytes instead of Python
+# strings, and spills its oldest entries to a node-local file beyond SIZE (CompactDepthFirst).
+#
+# All policies share the same small interface:  push() directories (with their costs, when
+# the policy uses them), pop() a batch for a worker, and split() off a share of the frontier
+# to send elsewhere.  pop() and split() return (dirs, costs), where costs is None unless the
+# policy is cost-based.
+
+from collections import deque
+from array import array
+import tempfile
+import heapq
+import math
+import os
+import numpy as np
+import wire
+
+# rough size of one entry in a directory file, used to guess the number of entries from st_size
+DIRENT_BYTES = 32
+
+
+
+################################################################################
+def subtree_cost(statinfo, parent_items, depth):
+    # estimate the cost of walking a directory we just found, from what its parent's
+    # scan already knows about it:
+    #   - entries directly inside, from the size of the directory file itself
+    #   - subdirectories, from st_nlink (2 + number of subdirectories on most filesystems)
+    #   - entries seen so far in its parent - big directories tend to sit among big siblings
+    #   - depth - deeper trees tend to be smaller
+    entries = 1 + statinfo.st_size // DIRENT_BYTES
+    subdirs = max(statinfo.st_nlink - 2, 0)
+    return int(entries * (1 + subdirs) * (1 + math.log2(1 + parent_items)) / (1 + depth))
+
+
+
+################################################################################
+class DepthFirst:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, dirs=None):
+        self.items = list(dirs) if dirs else []
+        return
+
+    def __len__(self):
+        return len(self.items)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def push(self, dirs, costs=None):
+        self.items.extend(dirs)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def pop(self, count):
+        batch = self.items[-count:]
+        del self.items[-count:]
+        batch.reverse() # preserve LIFO order of the frontier
+        return batch, None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split(self):
+        # the older half - shallowest, hence largest, subtrees
+        share = self.items[:len(self.items)//2]
+        del self.items[:len(share)]
+        return share, None
+
+
+
+################################################################################
+class CompactDepthFirst:
+
+    # Same LIFO order as DepthFirst, but paths are stored encoded and NUL-terminated back to
+    # back in a single bytearray, with an array of end offsets - about the length of the path
+    # plus 9 bytes per entry, rather than a full Python string object each.  Batches are
+    # encoded and decoded with a single call each way (see wire.py).
+    #
+    # Once the packed stack exceeds 'budget' bytes its older half is appended to a spill
+    # file.  Because the frontier is LIFO the file is a stack too: newer segments are always
+    # written after older ones, and a segment is only read back (and the file truncated)
+    # once everything in memory has been handed out.  So memory stays bounded by the budget
+    # however wide the tree, and the file is only ever accessed sequentially at its end.
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, dirs=None, budget=0):
+        self.data = bytearray()
+        self.ends = array('q')
+        self.budget = budget
+        self.spill = None
+        self.segments = []     # <--- (file offset, data bytes, entries) of each spilled segment, oldest first
+        self.nspilled = 0      # <--- entries currently on disk
+        self.max_nbytes = 0
+        self.max_spilled = 0
+        self.nspills = 0
+        if dirs: self.push(dirs)
+        return
+
+    def __len__(self):
+        return len(self.ends) + self.nspilled
+
+    def nbytes(self):
+        return len(self.data) + self.ends.itemsize*len(self.ends)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def spill_dir(self):
+        # node-local scratch if the batch system gives us one, the usual tempdir otherwise
+        for var in ('SLURM_JOB_TMPFS_TMPDIR', 'SLURM_JOB_LOCAL_TMPDIR'):
+            if os.getenv(var): return os.getenv(var)
+        return None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def push(self, dirs, costs=None):
+        if not dirs: return
+        blob = wire.encode_paths(dirs) + b'\0'
+
+        # entry ends are just past each terminating NUL.  a NUL right after another one
+        # (or first in line) is not a terminator but the marker of a split chunk.
+        nul = (np.frombuffer(blob, dtype=np.uint8) == 0)
+        after_nul = np.empty_like(nul)
+        after_nul[0] = True
+        after_nul[1:] = nul[:-1]
+        ends = np.flatnonzero(nul & ~after_nul) + (1 + len(self.data))
+        self.ends.frombytes(ends.astype(np.int64).tobytes())
+        self.data += blob
+
+        while self.budget and self.nbytes() > self.budget and len(self.ends) > 1:
+            self.spill_oldest()
+        self.max_nbytes = max(self.max_nbytes, self.nbytes())
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def spill_oldest(self):
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(prefix='walkstat_frontier_', dir=self.spill_dir())
+
+        count = len(self.ends)//2
+        cut = self.ends[count-1]
+
+        self.spill.seek(0, os.SEEK_END)
+        self.segments.append((self.spill.tell(), cut, count))
+        self.spill.write(self.data[:cut])
+        self.spill.write(self.ends[:count].tobytes())
+
+        del self.data[:cut]
+        self.ends = self.shifted(self.ends[count:], cut)
+        self.nspilled += count
+        self.nspills += 1
+        self.max_spilled = max(self.max_spilled, self.nspilled)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def unspill(self):
+        # stream the newest spilled segment back in, once memory is empty
+        assert (not self.ends)
+        offset, nbytes, count = self.segments.pop()
+        self.spill.seek(offset)
+        self.data = bytearray(self.spill.read(nbytes))
+        self.ends = array('q')
+        self.ends.frombytes(self.spill.read(count*self.ends.itemsize))
+        self.spill.truncate(offset)
+        self.nspilled -= count
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def shifted(self, ends, delta):
+        shifted = array('q')
+        shifted.frombytes((np.frombuffer(ends, dtype=np.int64) - delta).tobytes())
+        return shifted
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def take(self, first, last):
+        # decode entries [first, last) of the in-memory stack, and remove them
+        if last <= first: return []
+        start = self.ends[first-1] if first else 0
+        stop = self.ends[last-1]
+        batch = wire.decode_paths(bytes(self.data[start:stop-1]))
+        del self.data[start:stop]
+        if last < len(self.ends):
+            self.ends = self.ends[:first] + self.shifted(self.ends[last:], stop - start)
+        else:
+            del self.ends[first:]
+        return batch
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def pop(self, count):
+        batch = []
+        while len(batch) < count:
+            if not self.ends:
+                if not self.segments: break
+                self.unspill()
+            n = min(count - len(batch), len(self.ends))
+            part = self.take(len(self.ends) - n, len(self.ends))
+            part.reverse() # preserve LIFO order of the frontier
+            batch.extend(part)
+        return batch, None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split(self):
+        # the older half of what is in memory
+        if not self.ends and self.segments: self.unspill()
+        return self.take(0, len(self.ends)//2), None
+
+
+
+################################################################################
+class BreadthFirst:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, dirs=None):
+        self.items = deque(dirs) if dirs else deque()
+        return
+
+    def __len__(self):
+        return len(self.items)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def push(self, dirs, costs=None):
+        self.items.extend(dirs)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def pop(self, count):
+        count = min(count, len(self.items))
+        return [self.items.popleft() for i in range(count)], None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split(self):
+        return self.pop(len(self.items)//2)
+
+
+
+################################################################################
+class Priority:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, dirs=None):
+        self.heap = []
+        self.seq = 0 # <--- tie breaker, FIFO among equal costs
+        if dirs: self.push(dirs)
+        return
+
+    def __len__(self):
+        return len(self.heap)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def push(self, dirs, costs=None):
+        # directories without an estimate (e.g. the top-level ones) sort as cost 0
+        if costs is None: costs = [0]*len(dirs)
+        assert (len(costs) == len(dirs))
+        for d, c in zip(dirs, costs):
+            heapq.heappush(self.heap, (-c, self.seq, d))
+            self.seq += 1
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def pop(self, count):
+        count = min(count, len(self.heap))
+        batch = [heapq.heappop(self.heap) for i in range(count)]
+        return [d for c, s, d in batch], [-c for c, s, d in batch]
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split(self):
+        # the most expensive half, so large subtrees spread out rather than piling up here
+        return self.pop(len(self.heap)//2)
+
+
+
+################################################################################
+policies = { 'dfs'      : DepthFirst,
+             'bfs'      : BreadthFirst,
+             'priority' : Priority }
+
+def make_frontier(policy, dirs=None, memory=0):
+    if memory:
+        assert ('dfs' == policy)
+        return CompactDepthFirst(dirs, memory)
+    return policies[policy](dirs)
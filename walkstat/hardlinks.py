@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Hard link accounting: files with st_nlink > 1 are counted once per link during the walk,
+# so their (st_dev, st_ino) are kept aside and every extra link found is taken back out of
+# the byte totals at the end.
+#
+# Links to one inode may be found on any rank, so each candidate is routed to an owner rank
+# by a hash of its (dev, ino), in batched all-to-all rounds, and each owner finds the repeats
+# among its share - the sorting and memory for that are spread over all ranks, not put on one.
+
+import numpy as np
+from mpi4py import MPI
+from histograms import bin_sums
+
+# candidates each rank sends per all-to-all round (5 int64s each)
+BATCH = 1 << 20
+
+# columns of a candidate row
+DEV, INO, SIZE, UID, GID = range(5)
+
+
+
+################################################################################
+def owner_ranks(devs, inos, nranks):
+    # spread (dev, ino) pairs evenly over ranks, whatever the inode numbering looks like
+    h = inos.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + devs.astype(np.uint64)
+    return ((h >> np.uint64(17)) % np.uint64(nranks)).astype(np.int64)
+
+
+
+################################################################################
+class HardLinks:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self):
+        self.chunks = []  # <--- (n,5) int64 arrays from add()
+        self.files = []   # <--- one row per file from add_file()
+        self.dup_uids = {} # <--- after dedup(), on rank 0: id : (extra links, their bytes)
+        self.dup_gids = {}
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add(self, devs, inos, sizes, uids, gids):
+        # a block of files, as arrays
+        if len(devs): self.chunks.append(np.stack((devs, inos, sizes, uids, gids), axis=1).astype(np.int64))
+        return
+
+    def add_file(self, dev, ino, size, uid, gid):
+        self.files.append((dev, ino, size, uid, gid))
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def candidates(self):
+        chunks, self.chunks = self.chunks, []
+        if self.files:
+            chunks.append(np.array(self.files, dtype=np.int64))
+            self.files = []
+        return np.concatenate(chunks) if chunks else np.empty((0, 5), dtype=np.int64)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def exchange(self, comm, mine):
+        # route our candidates to their owners, BATCH rows per rank at a time.  returns what
+        # everybody sent us.
+        nranks = comm.Get_size()
+        nrounds = comm.allreduce((len(mine) + BATCH - 1) // BATCH, op=MPI.MAX)
+        received = []
+        for r in range(nrounds):
+            batch = mine[r*BATCH:(r+1)*BATCH]
+            owners = owner_ranks(batch[:,DEV], batch[:,INO], nranks)
+            batch = batch[np.argsort(owners, kind='stable')]
+            sendcounts = np.bincount(owners, minlength=nranks).astype(np.int64)
+            recvcounts = np.empty(nranks, dtype=np.int64)
+            comm.Alltoall(sendcounts, recvcounts)
+            incoming = np.empty((recvcounts.sum(), 5), dtype=np.int64)
+            comm.Alltoallv([np.ascontiguousarray(batch), 5*sendcounts, MPI.INT64_T],
+                           [incoming, 5*recvcounts, MPI.INT64_T])
+            received.append(incoming)
+        return np.concatenate(received) if received else np.empty((0, 5), dtype=np.int64)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def dedup(self, comm):
+        # every link past the first one found to an inode is an extra: sum those up by owner
+        # on the inode's owner rank, then on rank 0
+        rows = self.exchange(comm, self.candidates())
+        rows = rows[np.lexsort((rows[:,INO], rows[:,DEV]))]
+        extra = np.ones(len(rows), dtype=bool)
+        if len(rows):
+            extra[0] = False
+            extra[1:] = (rows[1:,DEV] == rows[:-1,DEV]) & (rows[1:,INO] == rows[:-1,INO])
+        rows = rows[extra]
+
+        mine = []
+        for col in (UID, GID):
+            uniq, inverse = np.unique(rows[:,col], return_inverse=True)
+            nlinks, nbytes = bin_sums(inverse, len(uniq), rows[:,SIZE])
+            mine.append(list(zip(uniq.tolist(), nlinks.tolist(), nbytes.tolist())))
+        parts = comm.gather(mine)
+        if not parts: return
+
+        for uid_part, gid_part in parts:
+            for dups, part in ((self.dup_uids, uid_part), (self.dup_gids, gid_part)):
+                for k, n, b in part:
+                    nlinks, nbytes = dups.get(k, (0, 0))
+                    dups[k] = (nlinks + n, nbytes + b)
+        return
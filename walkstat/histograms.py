@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Fixed-bucket file size & age histograms, overall and per uid/gid.
+#
+# Every row is one flat int64 array:
+#
+#   [ size counts | size bytes | mtime counts | mtime bytes | atime counts | atime bytes ]
+#
+# with log2 size buckets (0 bytes, [1,2), [2,4), ... bytes) and fixed age buckets (AGE_EDGES,
+# relative to one reference time for the whole job).  Files are collected a block or an entry
+# at a time and binned with numpy in bulk (flush(), about once per directory).  All rows have
+# the same shape, so every rank's histograms merge with one Reduce (see reduce()).
+
+import numpy as np
+from mpi4py import MPI
+
+# bucket 0 holds empty files, bucket b>0 sizes in [2**(b-1), 2**b)
+SIZE_BUCKETS = 64
+
+# age bucket upper edges, in days
+AGE_EDGES = [1, 7, 30, 90, 180, 365, 2*365, 3*365, 5*365, 10*365]
+AGE_LABELS = ['< 1 day', '1 - 7 days', '7 - 30 days', '30 - 90 days', '90 - 180 days', '180 days - 1 year',
+              '1 - 2 years', '2 - 3 years', '3 - 5 years', '5 - 10 years', '> 10 years']
+AGE_BUCKETS = len(AGE_LABELS)
+
+# offsets of each part of a row
+SIZE_COUNTS  = slice(0, SIZE_BUCKETS)
+SIZE_BYTES   = slice(SIZE_BUCKETS, 2*SIZE_BUCKETS)
+MTIME_COUNTS = slice(2*SIZE_BUCKETS, 2*SIZE_BUCKETS + AGE_BUCKETS)
+MTIME_BYTES  = slice(2*SIZE_BUCKETS + AGE_BUCKETS, 2*SIZE_BUCKETS + 2*AGE_BUCKETS)
+ATIME_COUNTS = slice(2*SIZE_BUCKETS + 2*AGE_BUCKETS, 2*SIZE_BUCKETS + 3*AGE_BUCKETS)
+ATIME_BYTES  = slice(2*SIZE_BUCKETS + 3*AGE_BUCKETS, 2*SIZE_BUCKETS + 4*AGE_BUCKETS)
+WIDTH = 2*SIZE_BUCKETS + 4*AGE_BUCKETS
+
+# bin whatever is pending once this many files have piled up, even mid-directory
+MAX_PENDING = 65536
+
+
+
+################################################################################
+def size_range(b):
+    # [low, high) bytes of size bucket b
+    return (0, 1) if not b else (2**(b-1), 2**b)
+
+def size_buckets(sizes):
+    # bit_length() of each size: frexp() exponents, exact for anything under 2**53 bytes
+    return np.minimum(np.frexp(sizes.astype(np.float64))[1], SIZE_BUCKETS-1)
+
+
+
+################################################################################
+class Histograms:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, reference_time):
+        self.age_edges = reference_time - 86400.*np.array(AGE_EDGES[::-1], dtype=np.float64)
+        self.uids = {}  # <--- id : row
+        self.gids = {}
+        self.total = np.zeros(WIDTH, dtype=np.int64)
+        self.pending = []  # <--- (sizes, uids, gids, mtimes, atimes) arrays from add()
+        self.pending_files = []  # <--- the same, one tuple per file from add_file()
+        self.npending = 0
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add(self, sizes, uids, gids, mtimes, atimes):
+        # a block of files, as arrays
+        if not len(sizes): return
+        self.pending.append((sizes, uids, gids, mtimes, atimes))
+        self.npending += len(sizes)
+        if self.npending >= MAX_PENDING: self.flush()
+        return
+
+    def add_file(self, size, uid, gid, mtime, atime):
+        self.pending_files.append((size, uid, gid, mtime, atime))
+        self.npending += 1
+        if self.npending >= MAX_PENDING: self.flush()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def flush(self):
+        # bin everything pending, all in one go
+        if not self.npending: return
+        chunks, self.pending = self.pending, []
+        if self.pending_files:
+            sizes, uids, gids, mtimes, atimes = zip(*self.pending_files)
+            chunks.append((np.array(sizes, dtype=np.int64), np.array(uids, dtype=np.int64), np.array(gids, dtype=np.int64),
+                           np.array(mtimes, dtype=np.float64), np.array(atimes, dtype=np.float64)))
+            self.pending_files = []
+        self.npending = 0
+
+        sizes, uids, gids, mtimes, atimes = (np.concatenate(column) for column in zip(*chunks))
+        sbins = size_buckets(sizes)
+        # (age edges run oldest first, so count buckets down from the youngest)
+        mbins = AGE_BUCKETS - 1 - np.searchsorted(self.age_edges, mtimes, side='left')
+        abins = AGE_BUCKETS - 1 - np.searchsorted(self.age_edges, atimes, side='left')
+
+        for rows, ids in ((self.uids, uids), (self.gids, gids)):
+            uniq, inverse = np.unique(ids, return_inverse=True)
+            binned = np.hstack(bin_rows(inverse, len(uniq), sbins, SIZE_BUCKETS, sizes) +
+                               bin_rows(inverse, len(uniq), mbins, AGE_BUCKETS, sizes) +
+                               bin_rows(inverse, len(uniq), abins, AGE_BUCKETS, sizes))
+            for id, row in zip(uniq.tolist(), binned):
+                if id in rows: rows[id] += row
+                else: rows[id] = row
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def reduce(self, comm, uid_order, gid_order):
+        # sum every rank's histograms onto rank 0: all rows, stacked in the (merged) id order
+        # given by the root, go in a single Reduce.  the overall histograms are the sum of
+        # the per-uid rows.
+        self.flush()
+        nuids = len(uid_order)
+        mine = np.zeros((nuids + len(gid_order), WIDTH), dtype=np.int64)
+        for i, id in enumerate(uid_order):
+            if id in self.uids: mine[i] = self.uids[id]
+        for i, id in enumerate(gid_order):
+            if id in self.gids: mine[nuids+i] = self.gids[id]
+        merged = np.zeros_like(mine) if 0 == comm.Get_rank() else None
+        comm.Reduce(mine, merged, op=MPI.SUM, root=0)
+        if merged is None: return
+
+        self.uids = dict(zip(uid_order, merged[:nuids]))
+        self.gids = dict(zip(gid_order, merged[nuids:]))
+        self.total = merged[:nuids].sum(axis=0)
+        return
+
+
+
+################################################################################
+def bin_sums(idx, n, *values):
+    # [counts, sums of each of 'values'] per bin 0..n-1, as int64 arrays.  sums add up in
+    # int64: bincount() weights are float64, inexact past 2**53 (bytes).
+    sums = [np.bincount(idx, minlength=n).astype(np.int64)]
+    for v in values:
+        sums.append(np.zeros(n, dtype=np.int64))
+        np.add.at(sums[-1], idx, v)
+    return sums
+
+def bin_rows(rows, nrows, bins, nbins, sizes):
+    # (counts, bytes) per row & bucket, each shaped (nrows, nbins)
+    counts, nbytes = bin_sums(rows*nbins + bins, nrows*nbins, sizes)
+    return (counts.reshape(nrows, nbins), nbytes.reshape(nrows, nbins))
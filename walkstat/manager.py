@@ -2,13 +2,20 @@
 
 from mpi4py import MPI
 from mpiclass import MPIClass, format_size, format_number, format_timespan
+from frontier import make_frontier
+from throttle import read_rate_file, POLL_INTERVAL
+import signal
 import os
 import time
 import sys
 from datetime import datetime
-from random import randint
+from collections import deque
 #from memory_profiler import profile
 
+# bounds (seconds) on how long the event loop sleeps when there is nothing to do
+IDLE_MIN = 1.e-5
+IDLE_MAX = 1.e-3
+
 ################################################################################
 class Manager(MPIClass):
 
@@ -19,12 +26,30 @@ class Manager(MPIClass):
         self.nsends = 0
         self.nrecvs = 0
         #self.dirs = dirs
-        self.dirs = self.options.dirs
+        self.dirs = make_frontier(self.options.frontier, self.options.dirs, self.options.frontier_memory)
         self.num_files = 0
         self.num_dirs = 0
         self.file_size = 0
         self.niter = 10*self.comm.Get_size()
-        self.any_dirs = [True for p in range(0,self.nranks)] # <--- assume all workers are busy until we hear otherwise
+
+        # ranks that talk to us directly - every worker, unless some are served by a node-local
+        # sub-manager.  Sub-managers stand in for all of their workers when sizing batches.
+        served = set(r for workers in self.submanagers.values() for r in workers)
+        self.clients = [p for p in range(1,self.nranks) if p not in served]
+        self.weights = [len(self.submanagers.get(p, [p])) for p in range(0,self.nranks)]
+        self.nworkers = self.nranks - 1 - len(self.submanagers)
+
+        self.waiting = deque() # <--- clients blocked waiting on 'execute', in the order they asked
+
+        # --stat-rate targets may change mid-run through a control file, re-read when it
+        # changes, or right away on SIGUSR1
+        self.stat_rate = self.options.stat_rate
+        self.scanners = [p for p in range(1,self.nranks) if p not in self.submanagers]
+        self.rate_file_mtime = None
+        self.rate_check_time = 0
+        self.reread_rate = bool(self.options.stat_rate_file) # <--- read it once up front
+        if self.options.stat_rate_file:
+            signal.signal(signal.SIGUSR1, self.on_sigusr1)
         self.progress_sizes = [0 for p in range(0,self.nranks)]
         self.progress_counts = [0 for p in range(0,self.nranks)]
         self.progress_time = self.start_time = MPI.Wtime()
@@ -34,13 +59,11 @@ class Manager(MPIClass):
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def finished(self):
+        # termination by counting: a client only says 'ready' once it has shipped all of its
+        # directories and has nothing outstanding, and then blocks until we answer.  so with
+        # an empty frontier and every client parked in self.waiting, no work can exist anywhere.
         self.iteration += 1
-
-        self.any_dirs[0] = True if self.dirs else False
-
-        if any(self.any_dirs): return False
-
-        return True
+        return not self.dirs and len(self.waiting) == len(self.clients)
 
 
 
@@ -54,6 +77,10 @@ class Manager(MPIClass):
 
         self.progress_time = curtime
         elapsed = (curtime - self.start_time)
+        # every rank's own counters, in place of what came in on messages (which from
+        # a sub-manager are node totals, and would be counted twice)
+        if self.progress_win:
+            self.progress_counts, self.progress_sizes = self.read_progress()
         self.progress_counts[0] = 0
         self.progress_sizes[0] = 0
         total_count = sum(self.progress_counts)
@@ -78,17 +105,170 @@ class Manager(MPIClass):
 
 
 
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def send_execute(self, dest, next_dirs, costs):
+        # every assignment also tells the worker how much we have queued up for each worker,
+        # which sets how eagerly it ships what it finds back to us (see BaseWorker.adapt_thresholds())
+        self.send_dirs(dest, self.tags['execute'], next_dirs, [len(self.dirs) // max(1, self.nworkers)], costs)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def on_sigusr1(self, signum, frame):
+        self.reread_rate = True
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def check_throttle(self):
+        # pick up a new --stat-rate target from the control file, and pass it on to every
+        # scanning rank, each of which takes its own share
+        if not self.options.stat_rate_file: return
+
+        curtime = MPI.Wtime()
+        if not self.reread_rate and (curtime - self.rate_check_time) < POLL_INTERVAL: return
+        self.rate_check_time = curtime
+
+        try:
+            mtime = os.stat(self.options.stat_rate_file).st_mtime
+        except OSError:
+            mtime = None
+        if not self.reread_rate and mtime == self.rate_file_mtime: return
+        self.rate_file_mtime = mtime
+        self.reread_rate = False
+
+        rate = read_rate_file(self.options.stat_rate_file)
+        if rate is None or rate == self.stat_rate: return
+        self.stat_rate = rate
+
+        print('  --> Stat rate target now {} ({})'.format('{} / sec'.format(format_number(rate)) if rate else 'unlimited',
+                                                          self.options.stat_rate_scope))
+        sys.stdout.flush()
+        for p in self.scanners:
+            self.send_dirs(p, self.tags['throttle'], counts=[rate]); self.nsends += 1
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def report_frontier_memory(self):
+        if not self.options.frontier_memory: return
+        print('  --> Frontier storage: {} peak in memory, {} dirs spilled at most ({} spills)'.format(format_size(self.dirs.max_nbytes),
+                                                                                                      format_number(self.dirs.max_spilled),
+                                                                                                      format_number(self.dirs.nspills)))
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def next_batch(self, rank):
+        # hand out an even share of the frontier to each worker, so a ready worker
+        # gets a chunk of directories per round trip when we have plenty, but only
+        # a single directory when the frontier is nearly drained (keep everyone busy).
+        # the share is capped by --batch-size, which defaults to 1 (no batching).
+        # a sub-manager gets the combined share of all the workers on its node.
+        weight = self.weights[rank]
+        # returns (dirs, costs), in the order given by the --frontier policy.
+        count = max(1, min(weight*self.options.batch_size, weight*len(self.dirs) // (2*self.nworkers)))
+        return self.dirs.pop(count)
+
+
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     #@profile
     def run(self):
 
         self.comm.Barrier()
+        cpu_start = time.process_time()
+
+        if 'probe' == self.options.manager_loop:
+            self.run_probe()
+        else:
+            self.run_event()
+
+        cpu_time = time.process_time() - cpu_start
+        elapsed = MPI.Wtime() - self.start_time
+        print('  --> Manager CPU time: {} over {} elapsed ({:.0f}% busy)'.format(format_timespan(cpu_time),
+                                                                                format_timespan(elapsed),
+                                                                                100.*cpu_time/elapsed))
+        sys.stdout.flush()
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run_event(self):
+
+        status = MPI.Status()
+        waiting = self.waiting
+        idle = 0.
+
+        # execution loop: receive every message in arrival order via matched probe, until the
+        # frontier is empty and every client is waiting on us.  'ready' messages are received
+        # right away and queued, so we never have to go looking for them rank by rank.
+        while not self.finished():
+
+            self.report_progress()
+            self.check_throttle()
+
+            msg = self.comm.improbe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
+
+            # nothing pending - back off a little rather than spin a core
+            if msg is None:
+                idle = min(2*idle or IDLE_MIN, IDLE_MAX)
+                time.sleep(idle)
+                continue
+            idle = 0.
+
+            source = status.Get_source()
+            tag = status.Get_tag()
+            payload, counts, costs = self.recv_dirs(status=status, message=msg); self.nrecvs += 1
+
+            # every message from our clients carries their current counts
+            self.progress_counts[source], self.progress_sizes[source] = counts
+
+            if tag == self.tags['dir_reply']:
+                self.dirs.push(payload, costs)
+                self.maxnumdirs = max(self.maxnumdirs, len(self.dirs))
+
+            elif tag == self.tags['ready']:
+                waiting.append(source)
+
+            elif tag == self.tags['dir_request']:
+                next_dirs, costs = self.next_batch(source) if self.dirs else ([], None)
+                self.send_execute(source, next_dirs, costs); self.nsends += 1
+
+            # hand out work, first come first served
+            while waiting and self.dirs:
+                ready_rank = waiting.popleft()
+                next_dirs, costs = self.next_batch(ready_rank)
+                self.send_execute(ready_rank, next_dirs, costs); self.nsends += 1
+        print('  --> Progress loop completed ({} sends / {} recvs)'.format(format_number(self.nsends),
+                                                                           format_number(self.nrecvs)))
+        print('  --> Maximum # of dirs at once on manager: {}'.format(format_number(self.maxnumdirs)))
+        self.report_frontier_memory()
+        print('  --> Finished dispatch, Terminating ranks')
+
+        # everyone is already waiting on us
+        self.nsends += self.forward_terminate(waiting)
+
+        self.report_progress(forceprint=True)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run_probe(self):
+
         status = MPI.Status()
 
         # execution loop, until we determine we are finished.
         while not self.finished():
 
             self.report_progress()
+            self.check_throttle()
 
             # check for incoming directories
             if self.comm.iprobe(source=MPI.ANY_SOURCE,
@@ -96,13 +276,12 @@ class Manager(MPIClass):
                                 status=status):
 
                 ready_rank = status.Get_source()
-                self.any_dirs[ready_rank] = False
-                more_dirs = self.comm.recv(source=ready_rank, tag=status.Get_tag()); self.nrecvs += 1
-                assert (len(more_dirs) >= 2)
-                # workers append some count info to the send buffer, so retrieve that
-                self.progress_sizes[ready_rank] = more_dirs.pop()
-                self.progress_counts[ready_rank] = more_dirs.pop()
-                self.dirs.extend(more_dirs)
+                # (a client is only idle once it says 'ready' - it may well still be busy
+                # after shipping us directories, e.g. sub-managers or with --prefetch)
+                more_dirs, counts, costs = self.recv_dirs(source=ready_rank, tag=status.Get_tag(), status=status); self.nrecvs += 1
+                # workers include some count info with the directories, so retrieve that
+                self.progress_counts[ready_rank], self.progress_sizes[ready_rank] = counts
+                self.dirs.push(more_dirs, costs)
                 self.maxnumdirs = max(self.maxnumdirs, len(self.dirs))
 
             # check for incoming status reports
@@ -111,50 +290,56 @@ class Manager(MPIClass):
                                 status=status):
 
                 reporting_rank = status.Get_source()
-                counts = self.comm.recv(source=reporting_rank, tag=status.Get_tag()); self.nrecvs += 1
-                assert (len(counts) == 2)
-                # workers append some count info to the send buffer, so retrieve that
-                self.progress_sizes[reporting_rank] = counts.pop()
-                self.progress_counts[reporting_rank] = counts.pop()
-
-            # check for incoming ready status
-            # case 1: we have data, we can probe ANY_SOURCE since we're about to send them work.
-            # case 2: we have no data...  ANY_SOURCE is too flexibile - we can get in a spamming loop
-            # with just a handful of ranks, not ever realizing all the others are done too. So, to
-            # handle this case we want to make sure we check each rank, not just the ones at the top
-            # of the probe queue (yeah... this was observed, especially on Derecho).  Since we require
-            # (eventually) hearing a 'ready' from all workers to break this loop when we have no data left to
-            # send, we need to be sure to ultimately hear from them all.
-            if self.comm.iprobe(source=MPI.ANY_SOURCE if self.dirs else randint(1,self.nranks-1),
+                _, counts, _ = self.recv_dirs(source=reporting_rank, tag=status.Get_tag(), status=status); self.nrecvs += 1
+                self.progress_counts[reporting_rank], self.progress_sizes[reporting_rank] = counts
+
+            # check for sub-managers or prefetching workers running low on work.  unlike
+            # 'ready' this is answered right away, with an empty batch if we have nothing to give.
+            if self.comm.iprobe(source=MPI.ANY_SOURCE,
+                                tag=self.tags['dir_request'],
+                                status=status):
+
+                request_rank = status.Get_source()
+                _, counts, _ = self.recv_dirs(source=request_rank, tag=status.Get_tag(), status=status); self.nrecvs += 1
+                self.progress_counts[request_rank], self.progress_sizes[request_rank] = counts
+                next_dirs, costs = self.next_batch(request_rank) if self.dirs else ([], None)
+                self.send_execute(request_rank, next_dirs, costs); self.nsends += 1
+
+            # check for incoming ready status.  we used to leave a 'ready' queued until we had
+            # work for its rank, and had to go looking for every rank in turn to be sure they
+            # were all done (probing ANY_SOURCE alone could keep finding the same handful of
+            # ranks, as observed on Derecho).  now every 'ready' is received right away, and
+            # ranks we cannot serve yet are parked in self.waiting - see finished().
+            if self.comm.iprobe(source=MPI.ANY_SOURCE,
                                 tag=self.tags['ready'],
                                 status=status):
 
                  ready_rank = status.Get_source()
-                 self.any_dirs[ready_rank] = False
-                 if self.dirs:
-                     next_dir = self.dirs.pop()
-                     counts = self.comm.sendrecv(next_dir,
-                                                 dest=ready_rank,   sendtag=self.tags['execute'],
-                                                 source=ready_rank, recvtag=status.Get_tag()); self.nrecvs +=1; self.nsends += 1
-                     self.any_dirs[ready_rank] = True
-                     assert (len(counts) == 2)
-                     self.progress_sizes[ready_rank] = counts.pop()
-                     self.progress_counts[ready_rank] = counts.pop()
-
-
-        # cleanup loop, send 'terminate' tag to each slave rank in
-        # whatever order they become ready. Don't forget to catch their final 'result'
+
+                 # a rank sends its directories before its 'ready', but we probe tag-by-tag.
+                 # don't consider it idle while its 'dir_reply' is still waiting to be received.
+                 if self.comm.iprobe(source=ready_rank, tag=self.tags['dir_reply']):
+                     continue
+
+                 _, counts, _ = self.recv_dirs(source=ready_rank, tag=status.Get_tag(), status=status); self.nrecvs += 1
+                 self.progress_counts[ready_rank], self.progress_sizes[ready_rank] = counts
+                 self.waiting.append(ready_rank)
+
+            # hand out work, first come first served
+            while self.waiting and self.dirs:
+                 ready_rank = self.waiting.popleft()
+                 next_dirs, costs = self.next_batch(ready_rank)
+                 self.send_execute(ready_rank, next_dirs, costs); self.nsends += 1
+
+
         print('  --> Progress loop completed ({} sends / {} recvs)'.format(format_number(self.nsends),
                                                                            format_number(self.nrecvs)))
         print('  --> Maximum # of dirs at once on manager: {}'.format(format_number(self.maxnumdirs)))
+        self.report_frontier_memory()
         print('  --> Finished dispatch, Terminating ranks')
-        for s in range(1,self.nranks):
-            counts = self.comm.recv(source=MPI.ANY_SOURCE, tag=self.tags['ready'], status=status); self.nrecvs += 1
-            ready_rank = status.Get_source()
-            self.progress_sizes[ready_rank] = counts.pop()
-            self.progress_counts[ready_rank] = counts.pop()
-            # send terminate tag, but no need to wait
-            self.comm.send(None, dest=ready_rank, tag=self.tags['terminate']); self.nsends += 1
+
+        # everyone is already waiting on us
+        self.nsends += self.forward_terminate(self.waiting)
 
         # OK, messages sent, report final progress
         self.report_progress(forceprint=True)
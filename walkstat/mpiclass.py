@@ -7,11 +7,18 @@ import pwd, grp
 import tempfile
 import shutil
 import platform
+import json
+import signal
 from collections import defaultdict
 from typing import NamedTuple
-from maxheap import MaxHeap
+from topk import TopK
+from hardlinks import HardLinks
+from rollup import Rollups
+from histograms import Histograms, SIZE_COUNTS, SIZE_BYTES, MTIME_COUNTS, MTIME_BYTES, ATIME_COUNTS, ATIME_BYTES, AGE_LABELS, size_range
 from datetime import datetime, timezone
 from parse_args import parse_options
+import numpy as np
+import wire
 have_humanfriendly = False
 try:
     import humanfriendly
@@ -19,14 +26,17 @@ try:
 except ImportError:
     pass
 
+# spreadsheet columns holding timestamps
+TIMESTAMP_COLUMNS = ('mtime', 'ctime', 'atime', 'max_mtime', 'max_ctime', 'max_atime')
+
 
 ################################################################################
 def flatten(matrix):
     if matrix: return [item for row in matrix for item in row]
     return None
 
-def format_size(val):
-    if have_humanfriendly: return humanfriendly.format_size(val)
+def format_size(val, binary=False):
+    if have_humanfriendly: return humanfriendly.format_size(val, binary=binary)
     return '{:.5e} bytes'.format(val)
 
 def format_number(val):
@@ -37,12 +47,18 @@ def format_timespan(val):
     if have_humanfriendly: return humanfriendly.format_timespan(val)
     return '{:.1f} seconds'.format(val)
 
+def format_size_bucket(b):
+    if not b: return '0 bytes'
+    low, high = size_range(b)
+    return '{} - {}'.format(format_size(low, binary=True), format_size(high, binary=True))
+
 
 
 ################################################################################
 class FileEntry(NamedTuple):
     path   : str
     nbytes : int
+    nalloc : int
     mtime  : float
     ctime  : float
     atime  : float
@@ -50,26 +66,54 @@ class FileEntry(NamedTuple):
 class DirEntry(NamedTuple):
     path      : str
     nbytes    : int
+    nalloc    : int
     nitems    : int
     max_mtime : float
     max_ctime : float
     max_atime : float
 
+class DirTally:
+    # running totals for the contents of one directory, or for our part of one that
+    # was split across ranks
+    def __init__(self):
+        self.nitems = 0
+        self.nbytes = 0
+        self.nalloc = 0
+        self.max_mtime = -1
+        self.max_ctime = -1
+        self.max_atime = -1
+        return
+
+    def merge(self, other):
+        self.nitems += other.nitems
+        self.nbytes += other.nbytes
+        self.nalloc += other.nalloc
+        self.max_mtime = max(self.max_mtime, other.max_mtime)
+        self.max_ctime = max(self.max_ctime, other.max_ctime)
+        self.max_atime = max(self.max_atime, other.max_atime)
+        return
+
+    def entry(self, dirname):
+        return DirEntry(dirname, self.nbytes, self.nalloc, self.nitems,
+                        self.max_mtime, self.max_ctime, self.max_atime)
+
 class IDCounts:
+    # per-owner totals.  during the walk they are keyed by numeric id only, names are
+    # looked up once for the merged set on rank 0 (see MPIClass.resolve_names())
+    kind = None
+    COLUMNS = ['name', 'nbytes', 'nbytes_dedup', 'nalloc', 'nitems'] # <--- to_dict() keys
+
     def __init__(self):
         self.id = None
         self.name = None
         self.nbytes = 0
+        self.nalloc = 0 # <--- allocated bytes, st_blocks*512
         self.nitems = 0
+        self.dup_nbytes = 0 # <--- bytes of extra hard links to files already counted
         return
 
-    def set_id(self,id_in):
-        if id_in != self.id:
-            self.id = id_in
-            self._id_to_name()
-        return
-
-    def _id_to_name(self):
+    @staticmethod
+    def lookup(id):
         assert False
         return
 
@@ -77,32 +121,32 @@ class IDCounts:
         d = { 'name'   : self.name,
               #'id'     : self.id,
               'nbytes' : self.nbytes,
+              'nbytes_dedup' : self.nbytes - self.dup_nbytes,
+              'nalloc' : self.nalloc,
               'nitems' : self.nitems }
         return d
 
 class UIDCounts(IDCounts):
+    kind = 'uid'
+
     def __init__(self):
         IDCounts.__init__(self)
         return
 
-    def _id_to_name(self):
-        try:
-            self.name = pwd.getpwuid(self.id).pw_name
-        except KeyError:
-            self.name = '{}*'.format(self.id)
-        return
+    @staticmethod
+    def lookup(id):
+        return pwd.getpwuid(id).pw_name
 
 class GIDCounts(IDCounts):
+    kind = 'gid'
+
     def __init__(self):
         IDCounts.__init__(self)
         return
 
-    def _id_to_name(self):
-        try:
-            self.name = grp.getgrgid(self.id).gr_name
-        except KeyError:
-            self.name = '{}*'.format(self.id)
-        return
+    @staticmethod
+    def lookup(id):
+        return grp.getgrgid(id).gr_name
 
 
 
@@ -117,6 +161,9 @@ class MPIClass:
             'dir_request'   : 30,
             'dir_reply'     : 31,
             'progress'      : 40,
+            'throttle'      : 50,
+            'topk'          : 60,
+            'rollup'        : 70,
             'terminate'     : 1000 }
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -128,22 +175,233 @@ class MPIClass:
         self.i_am_root = False if self.rank else True
         self.options = self.comm.bcast(options)
         self.dirs = None
+        self.split_dir_parts = {}
+        self.nsplit = 0
+        self.ship_costs = ('priority' == self.options.frontier)
         self.maxnumdirs = 0
         self.num_files = 0
         self.num_dirs = 0
         self.num_items = 0
         self.total_size = 0
+        self.total_alloc = 0
+        self.num_pruned = 0 # <--- entries skipped by --exclude / --include
+        self.idle_time = 0.
+        self.nwaits = 0
+        self.nsent = defaultdict(int) # <--- messages sent, by tag
+        self.ndirs_sent = 0
 
         self.st_modes = defaultdict(int)
 
         self.uids = defaultdict(UIDCounts)
         self.gids = defaultdict(GIDCounts)
 
-        self.top_nitems_dirs   = MaxHeap(self.options.heap_size)
-        self.top_nbytes_dirs   = MaxHeap(self.options.heap_size)
-        self.top_nbytes_files  = MaxHeap(self.options.heap_size)
-        self.oldest_mtime_dirs = MaxHeap(self.options.heap_size)
-        self.oldest_atime_dirs = MaxHeap(self.options.heap_size)
+        self.top_nitems_dirs   = TopK(self.options.heap_size, DirEntry)
+        self.top_nbytes_dirs   = TopK(self.options.heap_size, DirEntry)
+        self.top_nbytes_files  = TopK(self.options.heap_size, FileEntry)
+        self.top_overalloc_files = TopK(self.options.heap_size, FileEntry) # <--- by allocated - size
+        self.top_sparse_files    = TopK(self.options.heap_size, FileEntry) # <--- by size - allocated
+        self.oldest_mtime_dirs = TopK(self.options.heap_size, DirEntry, key_type=float)
+        self.oldest_atime_dirs = TopK(self.options.heap_size, DirEntry, key_type=float)
+
+        # --rollup-depth: inclusive totals of the directories near the top
+        self.rollups = None
+        if self.options.rollup_depth is not None:
+            self.rollups = Rollups(self.options.dirs, self.options.rollup_depth)
+
+        # file size & age distributions, overall and per uid/gid
+        self.histograms = Histograms(self.options.start_time)
+
+        # files with more than one link, to count each of them once in the end
+        self.hardlinks = HardLinks()
+
+        # two-level mode: one rank per node acts as a sub-manager for the other
+        # ranks on that node, and only sub-managers talk to the Manager on rank 0
+        self.manager_rank = 0
+        self.submanagers = {}
+        if self.options.hierarchical:
+            self.init_node_layout()
+        self.i_am_submanager = self.rank in self.submanagers
+
+        # --stat-rate: how many scanning ranks share each target
+        self.i_scan = not self.i_am_submanager and (self.rank or 'steal' == self.options.engine)
+        self.rate_divisor = 1
+        self.bucket = None
+        if self.options.stat_rate_file and not self.i_am_root:
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN) # <--- for rank 0, but mpirun forwards it to everyone
+        if self.options.stat_rate or self.options.stat_rate_file:
+            self.init_rate_divisor()
+
+        # one-sided progress channel: rank 0 exposes a (count, size) slot per rank
+        self.progress_win = None
+        if self.options.progress_rma and 'manager' == self.options.engine:
+            self.init_progress_window()
+
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def init_rate_divisor(self):
+        # a global target is shared by every rank doing stat()s, a per-node one by those on our node
+        scanning = 1 if self.i_scan else 0
+        if 'node' == self.options.stat_rate_scope:
+            node_comm = self.split_nodes()
+            self.rate_divisor = max(1, node_comm.allreduce(scanning))
+            node_comm.Free()
+        else:
+            self.rate_divisor = max(1, self.comm.allreduce(scanning))
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def init_progress_window(self):
+        # collective over all ranks, only rank 0 holds any memory
+        itemsize = MPI.INT64_T.Get_size()
+        nbytes = 2*self.nranks*itemsize if self.i_am_root else 0
+        self.progress_win = MPI.Win.Allocate(nbytes, itemsize, comm=self.comm)
+        self.progress_buf = np.zeros(2, dtype=np.int64)
+        if self.i_am_root:
+            self.progress_slots = np.frombuffer(self.progress_win.tomemory(), dtype=np.int64)
+            self.progress_win.Lock(0)
+            self.progress_slots[:] = 0
+            self.progress_win.Unlock(0)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def publish_progress(self):
+        # overwrite our own slot on rank 0.  a passive-target epoch of our own, so
+        # this never waits on the Manager, whatever it is doing
+        self.progress_buf[0] = self.num_items
+        self.progress_buf[1] = self.total_size
+        self.progress_win.Lock(0, MPI.LOCK_SHARED)
+        self.progress_win.Put([self.progress_buf, MPI.INT64_T], 0, target=(2*self.rank, 2, MPI.INT64_T))
+        self.progress_win.Unlock(0)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def read_progress(self):
+        # rank 0 only: (counts, sizes) of every rank, straight from local memory
+        self.progress_win.Lock(0, MPI.LOCK_SHARED)
+        slots = self.progress_slots.copy()
+        self.progress_win.Unlock(0)
+        return slots[0::2].tolist(), slots[1::2].tolist()
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def ncounts(self, tag):
+        # how many counters ride along on each type of message.
+        # 'terminate' carries only counters: the ranks to forward it to.
+        # 'execute' carries the sender's backlog per worker.
+        if tag == self.tags['terminate']: return None
+        if tag in (self.tags['execute'], self.tags['throttle']): return 1
+        return 2
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def send_dirs(self, dest, tag, dirs=None, counts=None, costs=None):
+        # every Manager <-> worker message is a (possibly empty) list of directories
+        # plus a few counters.  with '--frontier priority' the directories also carry
+        # their estimated subtree costs.
+        if self.ship_costs and dirs and not costs: costs = [0]*len(dirs)
+        if not self.ship_costs: costs = None
+        self.nsent[tag] += 1
+
+        if 'binary' == self.options.wire:
+            buf = wire.pack(dirs, counts, costs)
+            self.comm.Send([buf, MPI.BYTE], dest=dest, tag=tag)
+            return
+
+        # pickled: costs then counters are appended to the directory list, and a bare
+        # message is just None
+        msg = None
+        if dirs is not None or counts is not None:
+            msg = list(dirs) if dirs else []
+            if costs: msg.extend(costs)
+            if counts: msg.extend(counts)
+        self.comm.send(msg, dest=dest, tag=tag)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def recv_dirs(self, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=None, message=None):
+        # counterpart to send_dirs(), returns (dirs, counts, costs).  pass 'message' to
+        # receive a message already matched with improbe()/mprobe().
+        if status is None: status = MPI.Status()
+
+        if 'binary' == self.options.wire:
+            if message is None: message = self.comm.mprobe(source=source, tag=tag, status=status)
+            buf = np.empty(status.Get_count(MPI.BYTE), dtype=np.uint8)
+            message.Recv([buf, MPI.BYTE])
+            return wire.unpack(buf)
+
+        if message is None:
+            msg = self.comm.recv(source=source, tag=tag, status=status)
+        else:
+            msg = message.recv()
+        if msg is None: return [], [], []
+        n = self.ncounts(status.Get_tag())
+        if n is None: return [], msg, []
+        counts = msg[len(msg)-n:]
+        del msg[len(msg)-n:]
+        if not self.ship_costs: return msg, counts, []
+        n = len(msg)//2
+        costs = msg[n:]
+        del msg[n:]
+        return msg, counts, costs
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def forward_terminate(self, ranks):
+        # shut down 'ranks' along a binary tree: hand the upper half of the list to its
+        # first rank to take care of, and keep halving what is left.  every rank involved
+        # sends O(log P) messages, and the last one is reached after O(log P) hops.
+        # only ever used once every one of 'ranks' is idle and blocked on a receive.
+        ranks = list(ranks)
+        nsent = 0
+        while ranks:
+            mid = len(ranks)//2
+            self.send_dirs(ranks[mid], self.tags['terminate'], counts=ranks[mid+1:])
+            ranks = ranks[:mid]
+            nsent += 1
+        return nsent
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split_nodes(self):
+        # split by shared-memory node, or into fixed-size groups of consecutive ranks if requested
+        if self.options.node_size:
+            return self.comm.Split(self.rank // self.options.node_size, self.rank)
+        return self.comm.Split_type(MPI.COMM_TYPE_SHARED, key=self.rank)
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def init_node_layout(self):
+
+        node_comm = self.split_nodes()
+
+        # rank 0 is always the global Manager, never a node-local worker
+        node_ranks = [r for r in node_comm.allgather(self.rank) if r]
+        node_comm.Free()
+
+        # a sub-manager only pays off with at least two workers behind it,
+        # otherwise the node's ranks talk to the Manager directly
+        local = (node_ranks[0], node_ranks[1:]) if len(node_ranks) >= 3 else (None, [])
+
+        for sub, workers in self.comm.allgather(local):
+            if sub is None: continue
+            self.submanagers[sub] = workers
+            if self.rank in workers: self.manager_rank = sub
 
         return
 
@@ -207,17 +465,16 @@ class MPIClass:
 
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    def gather_and_sum_ids(self, my_part):
-        result = defaultdict(IDCounts)
-        parts = self.comm.gather(list(my_part.values()))
+    def gather_and_sum_ids(self, my_part, cls):
+        result = defaultdict(cls)
+        parts = self.comm.gather([(k, obj.nitems, obj.nbytes, obj.nalloc) for k,obj in my_part.items()])
         if parts:
             for part in parts:
-                for obj in part:
-                    k = obj.id
-                    result[k].id = obj.id
-                    result[k].name = obj.name
-                    result[k].nbytes += obj.nbytes
-                    result[k].nitems += obj.nitems
+                for k, nitems, nbytes, nalloc in part:
+                    result[k].id = k
+                    result[k].nbytes += nbytes
+                    result[k].nalloc += nalloc
+                    result[k].nitems += nitems
 
             # sort from largest-val-to-smallest
             # https://stackoverflow.com/questions/613183/how-do-i-sort-a-dictionary-by-value
@@ -226,6 +483,82 @@ class MPIClass:
 
 
 
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def resolve_names(self, *tallies):
+        # user & group names for the merged ids, looked up once here on rank 0 so no scan
+        # ever waits on the directory service (LDAP/SSSD can be slow).  with --id-cache,
+        # names found on earlier runs are reused and new ones added.
+        cache = {}
+        if self.options.id_cache:
+            try:
+                with open(self.options.id_cache) as f:
+                    cache = json.load(f)
+            except FileNotFoundError:
+                pass # <--- first run, we'll create it
+            except (OSError, ValueError) as error:
+                print('  --> Cannot read --id-cache: {}'.format(error), file=sys.stderr)
+
+        nlookups = 0
+        for ids in tallies:
+            for k,v in ids.items():
+                known = cache.setdefault(v.kind, {})
+                v.name = known.get(str(k))
+                if v.name is not None: continue
+                nlookups += 1
+                try:
+                    v.name = known[str(k)] = v.lookup(k)
+                except KeyError:
+                    v.name = '{}*'.format(k) # <--- unknown now, but may be known next time, don't cache
+
+        if self.options.id_cache and nlookups:
+            try:
+                tmpname = '{}.{}'.format(self.options.id_cache, os.getpid())
+                with open(tmpname, 'w') as f:
+                    json.dump(cache, f, indent=1, sort_keys=True)
+                os.replace(tmpname, self.options.id_cache)
+            except OSError as error:
+                print('  --> Cannot update --id-cache: {}'.format(error), file=sys.stderr)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add_dir_entry(self, de):
+        # track the size & count of a directory in our top heaps
+        self.top_nitems_dirs.add((de.nitems, de))
+        self.top_nbytes_dirs.add((de.nbytes, de))
+
+        if de.nitems >= self.options.threshold_count or de.nbytes >= self.options.threshold_size:
+            if de.max_mtime > 0: self.oldest_mtime_dirs.add((-de.max_mtime, de)) # (-) to turn maxheap into a minheap
+            if de.max_atime > 0: self.oldest_atime_dirs.add((-de.max_atime, de)) # (-) to turn maxheap into a minheap
+
+        # and in the subtree totals of it and its ancestors
+        if self.rollups: self.rollups.add(de)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def merge_split_dirs(self):
+        # directories split across ranks (--split-threshold) were tallied in parts,
+        # combine them on root so they enter the heaps as a whole
+        parts = self.comm.gather(list(self.split_dir_parts.items()))
+        nsplit = self.comm.reduce(self.nsplit)
+        if not self.i_am_root: return
+
+        merged = defaultdict(DirTally)
+        for part in parts:
+            for dirname, tally in part:
+                merged[dirname].merge(tally)
+        for dirname, tally in merged.items():
+            self.add_dir_entry(tally.entry(dirname))
+
+        if nsplit:
+            print('  --> Split {} huge directories across ranks'.format(format_number(nsplit)))
+        return
+
+
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def summary(self, verbose=False):
 
@@ -233,17 +566,45 @@ class MPIClass:
 
         sep='-'*80
 
-        # gather heaps
-        self.top_nitems_dirs.reset   (flatten( self.comm.gather(self.top_nitems_dirs.get_list())))
-        self.top_nbytes_dirs.reset   (flatten( self.comm.gather(self.top_nbytes_dirs.get_list())))
-        self.top_nbytes_files.reset  (flatten( self.comm.gather(self.top_nbytes_files.get_list())))
-        self.oldest_mtime_dirs.reset (flatten( self.comm.gather(self.oldest_mtime_dirs.get_list())))
-        self.oldest_atime_dirs.reset (flatten( self.comm.gather(self.oldest_atime_dirs.get_list())))
+        if self.progress_win:
+            self.progress_win.Free()
+            self.progress_win = None
+
+        self.merge_split_dirs()
+
+        # merge top lists onto rank 0
+        self.top_nitems_dirs.reduce   (self.comm, self.tags['topk'])
+        self.top_nbytes_dirs.reduce   (self.comm, self.tags['topk'])
+        self.top_nbytes_files.reduce  (self.comm, self.tags['topk'])
+        self.top_overalloc_files.reduce(self.comm, self.tags['topk'])
+        self.top_sparse_files.reduce  (self.comm, self.tags['topk'])
+        if self.rollups: self.rollups.reduce(self.comm, self.tags['rollup'])
+        self.oldest_mtime_dirs.reduce (self.comm, self.tags['topk'])
+        self.oldest_atime_dirs.reduce (self.comm, self.tags['topk'])
 
         self.st_modes   = self.gather_and_sum_dict(self.st_modes)
 
-        self.uids = self.gather_and_sum_ids(self.uids)
-        self.gids = self.gather_and_sum_ids(self.gids)
+        self.uids = self.gather_and_sum_ids(self.uids, UIDCounts)
+        self.gids = self.gather_and_sum_ids(self.gids, GIDCounts)
+
+        # size & age histograms: every rank's rows, in the merged id order, in one Reduce
+        uid_order, gid_order = self.comm.bcast((list(self.uids), list(self.gids)) if self.i_am_root else None)
+        self.histograms.reduce(self.comm, uid_order, gid_order)
+
+        # take the extra links to already counted files back out of the per-owner byte totals
+        self.hardlinks.dedup(self.comm)
+        for ids, dups in ((self.uids, self.hardlinks.dup_uids), (self.gids, self.hardlinks.dup_gids)):
+            for k, (nlinks, nbytes) in dups.items(): ids[k].dup_nbytes += nbytes
+
+        total_count = self.comm.reduce(self.num_items)
+        total_size  = self.comm.reduce(self.total_size)
+        total_alloc = self.comm.reduce(self.total_alloc)
+        num_pruned  = self.comm.reduce(self.num_pruned)
+
+        # time workers spent blocked waiting on their next assignment
+        waits = self.comm.gather((self.idle_time, self.nwaits))
+        throttled = self.comm.gather(self.bucket.waited if self.bucket else None)
+        traffic = self.comm.gather((dict(self.nsent), self.ndirs_sent) if self.rank else None)
 
         sys.stdout.flush()
 
@@ -261,6 +622,8 @@ class MPIClass:
                         for k,v in self.st_modes.items():
                             print('   {:5s} : {:,}'.format(k,v))
                         print('   {:5s} : {}'.format('size',format_size(self.total_size)))
+                        print('   {:5s} : {}'.format('alloc',format_size(self.total_alloc)))
+                        print('   {:5s} : {} over {} waits'.format('idle',format_timespan(self.idle_time),format_number(self.nwaits)))
 
 
         #------------------------------
@@ -268,18 +631,88 @@ class MPIClass:
         # root rank summarizes results
         if not self.i_am_root: return
 
+        waits = [w for w in waits if w[1]]
+        if waits:
+            idle_times = [t for t,n in waits]
+            nwaits = sum(n for t,n in waits)
+            print('  --> Worker wait on dispatch: {:.1f} usec mean over {} requests, {} max / {} mean idle per rank'.format(1.e6*sum(idle_times)/nwaits,
+                                                                                                                            format_number(nwaits),
+                                                                                                                            format_timespan(max(idle_times)),
+                                                                                                                            format_timespan(sum(idle_times)/len(waits))))
+
+        # what the workers' --send-policy cost in messages, to compare against the item rate above
+        if 'manager' == self.options.engine and self.nranks > 1:
+            nsent = defaultdict(int)
+            for sent, _ in traffic[1:]:
+                for tag, n in sent.items(): nsent[tag] += n
+            nbatches = nsent[self.tags['dir_reply']]
+            ndirs = sum(n for _, n in traffic[1:])
+            nmsgs = sum(nsent[self.tags[t]] for t in ('dir_reply', 'progress', 'ready', 'dir_request'))
+            print('  --> Worker messages ({} policy): {} dir batches ({:.1f} dirs each), {} progress, {} ready, {} requests, {:.1f} per 1,000 items'.format(self.options.send_policy,
+                                                                                                                                                        format_number(nbatches),
+                                                                                                                                                        float(ndirs)/max(1, nbatches),
+                                                                                                                                                        format_number(nsent[self.tags['progress']]),
+                                                                                                                                                        format_number(nsent[self.tags['ready']]),
+                                                                                                                                                        format_number(nsent[self.tags['dir_request']]),
+                                                                                                                                                        1000.*nmsgs/max(1, total_count)))
+
+        if 'files' == self.options.stat:
+            print('  --> --stat files: sizes, owners and times are of files only, not of directories or links')
+        elif 'none' == self.options.stat:
+            print('  --> --stat none: counts and types only, no sizes, owners or times')
+
+        if self.options.filter:
+            print('  --> Skipped {} entries by --exclude / --include, excluded directories with all their contents'.format(format_number(num_pruned)))
+
+        throttled = [t for t in throttled if t is not None]
+        if throttled:
+            print('  --> Held back by --stat-rate: {} max / {} mean per rank'.format(format_timespan(max(throttled)),
+                                                                                  format_timespan(sum(throttled)/len(throttled))))
+
+        # hard links: files reached by more than one path were counted once per path above
+        nlinks = sum(n for n,b in self.hardlinks.dup_uids.values())
+        dup_nbytes = sum(b for n,b in self.hardlinks.dup_uids.values())
+        if nlinks:
+            print('  --> Hard links: {} extra links to files already counted, {} ({} apparent / {} deduplicated)'.format(format_number(nlinks),
+                                                                                                                 format_size(dup_nbytes),
+                                                                                                                 format_size(total_size),
+                                                                                                                 format_size(total_size - dup_nbytes)))
+
         # summarize stat types
         print(('\n'+sep)*3)
-        print('Total Count: {} items'.format(format_number(self.progress_counts[0])))
-        print('Total Size:  {}'.format(format_size(self.progress_sizes[0])))
+        print('Total Count: {} items'.format(format_number(total_count)))
+        if nlinks:
+            print('Total Size:  {} apparent, {} deduplicated'.format(format_size(total_size), format_size(total_size - dup_nbytes)))
+        else:
+            print('Total Size:  {}'.format(format_size(total_size)))
+        print('Allocated:   {}'.format(format_size(total_alloc)))
         print('Type Counts:')
         for k,v in self.st_modes.items(): print('   {:5s} : {:,}'.format(k, v))
 
         # summarize by uid/gid
-        print('\n' + sep + '\nUsers:\n' + sep)
-        for k,v in self.uids.items(): print('{:>12} : {:>10} {:>10}'.format(v.name,format_size(v.nbytes),format_number(v.nitems)))
-        print('\n' + sep + '\nGroups:\n' + sep)
-        for k,v in self.gids.items(): print('{:>12} : {:>10} {:>10}'.format(v.name,format_size(v.nbytes),format_number(v.nitems)))
+        self.resolve_names(self.uids, self.gids)
+        for title, ids in (('Users', self.uids), ('Groups', self.gids)):
+            header = '{:<15}{:>10} {:>10} {:>10}'.format(title+':', 'apparent', 'items', 'allocated')
+            if nlinks: header += ' {:>12}'.format('deduplicated')
+            print('\n' + sep + '\n' + header + '\n' + sep)
+            for k,v in ids.items():
+                line = '{:>12} : {:>10} {:>10} {:>10}'.format(v.name,format_size(v.nbytes),format_number(v.nitems),format_size(v.nalloc))
+                if nlinks: line += ' {:>12}'.format(format_size(v.nbytes - v.dup_nbytes))
+                print(line)
+
+        # summarize file size & age distributions
+        hist = self.histograms.total
+        if hist[SIZE_COUNTS].any():
+            print('\n' + sep + '\nFile Sizes:\n' + sep)
+            used = np.flatnonzero(hist[SIZE_COUNTS])
+            for b in range(used[0], used[-1]+1):
+                print('{:>21} : {:>10} {:>10}'.format(format_size_bucket(b), format_number(int(hist[SIZE_COUNTS][b])),
+                                                      format_size(int(hist[SIZE_BYTES][b]))))
+            print('\n' + sep + '\nFile Ages (mtime / atime):\n' + sep)
+            for b, label in enumerate(AGE_LABELS):
+                print('{:>21} : {:>10} {:>10}   {:>10} {:>10}'.format(label,
+                                                                      format_number(int(hist[MTIME_COUNTS][b])), format_size(int(hist[MTIME_BYTES][b])),
+                                                                      format_number(int(hist[ATIME_COUNTS][b])), format_size(int(hist[ATIME_BYTES][b]))))
 
         # summarize top files & directories
         print('\n' + sep + '\nLargest Dirs (file count):\n' + sep)
@@ -288,6 +721,10 @@ class MPIClass:
         for idx,de in self.top_nbytes_dirs.top(50): print('{:>10} {:>10} {}/'.format(format_size(de.nbytes), format_number(de.nitems), de.path))
         print('\n' + sep + '\nLargest Files (size):\n' + sep)
         for idx,fe in self.top_nbytes_files.top(50): print('{:>10} {}'.format(format_size(fe.nbytes), fe.path))
+        print('\n' + sep + '\nMost Over-allocated Files (allocated - size, size, allocated):\n' + sep)
+        for idx,fe in self.top_overalloc_files.top(50): print('{:>10} {:>10} {:>10} {}'.format(format_size(idx), format_size(fe.nbytes), format_size(fe.nalloc), fe.path))
+        print('\n' + sep + '\nMost Sparse Files (size - allocated, size, allocated):\n' + sep)
+        for idx,fe in self.top_sparse_files.top(50): print('{:>10} {:>10} {:>10} {}'.format(format_size(idx), format_size(fe.nbytes), format_size(fe.nalloc), fe.path))
 
         # summarize oldest paths
         print('\n' + sep + '\nOldest Dirs (contents mtimes):\n' + sep)
@@ -297,6 +734,14 @@ class MPIClass:
         for idx,de in self.oldest_atime_dirs.top(50): print('{}  {:>10} {:>10} {}/'.format(datetime.fromtimestamp(de.max_atime).strftime('%Y-%m-%d %H:%M:%S'),
                                                                                                format_size(de.nbytes), format_number(de.nitems), de.path))
 
+        # summarize whole subtrees
+        if self.rollups:
+            print('\n' + sep + '\nSubtree Totals (size, items, allocated, latest mtime, to depth {}):\n'.format(self.options.rollup_depth) + sep)
+            for path, depth, nitems, nbytes, nalloc, max_mtime in self.rollups.rows():
+                print('{:>10} {:>10} {:>10} {:19} {}/'.format(format_size(nbytes), format_number(nitems), format_size(nalloc),
+                                                              datetime.fromtimestamp(max_mtime).strftime('%Y-%m-%d %H:%M:%S') if max_mtime > 0 else '',
+                                                              path))
+
         # write summary file, if requested
         if self.options.summary:
             print('\n--> Writing summary to {}'.format(self.options.summary))
@@ -316,10 +761,11 @@ class MPIClass:
                 #for idx,de in self.oldest_ctime_dirs.top(self.options.heap_size): l.append(de)
                 #for idx,de in self.oldest_atime_dirs.top(self.options.heap_size): l.append(de)
                 l = sorted(set(l), key = lambda x: x.nitems, reverse=True)
-                df = pd.DataFrame(l)
+                df = pd.DataFrame(l, columns=DirEntry._fields) # <--- (columns even if empty, e.g. --stat none)
                 for ts in ['max_mtime', 'max_ctime', 'max_atime']: df[ts] = pd.to_datetime(df[ts], unit='s')
                 df['size'] = df['nbytes'].apply(lambda x: format_size(x))
-                df = df[['path','nitems','size','nbytes','max_mtime','max_atime']] # <-- rearrange, drop ctime (don't report what will likely be confusing information)
+                df['allocated'] = df['nalloc'].apply(lambda x: format_size(x))
+                df = df[['path','nitems','size','nbytes','allocated','max_mtime','max_atime']] # <-- rearrange, drop ctime (don't report what will likely be confusing information)
                 #print(df)
                 df.to_excel(writer, sheet_name=sheet_prefix+'Directories', index=False)
                 del l, df
@@ -328,27 +774,52 @@ class MPIClass:
                 l = []
                 for idx,fe in self.top_nbytes_files.top(self.options.heap_size): l.append(fe)
                 l = sorted(set(l), key = lambda x: x.nbytes, reverse=True)
-                df = pd.DataFrame(l)
+                df = pd.DataFrame(l, columns=FileEntry._fields)
                 for ts in ['mtime', 'ctime', 'atime']: df[ts] = pd.to_datetime(df[ts], unit='s')
                 df['size'] = df['nbytes'].apply(lambda x: format_size(x))
-                df = df[['path','size','nbytes','mtime','atime']] # <-- rearrange, drop ctime (don't report what will likely be confusing information)
+                df['allocated'] = df['nalloc'].apply(lambda x: format_size(x))
+                df = df[['path','size','nbytes','allocated','mtime','atime']] # <-- rearrange, drop ctime (don't report what will likely be confusing information)
                 #print(df)
                 df.to_excel(writer, sheet_name=sheet_prefix+'Files', index=False)
                 del l, df
 
+                # sparse & over-allocated files
+                l = []
+                for kind, heap in (('over-allocated', self.top_overalloc_files), ('sparse', self.top_sparse_files)):
+                    for idx,fe in heap.top(self.options.heap_size):
+                        l.append((fe.path, kind, format_size(idx), format_size(fe.nbytes), fe.nbytes, format_size(fe.nalloc), fe.mtime, fe.atime))
+                df = pd.DataFrame(l, columns=['path', 'kind', 'difference', 'size', 'nbytes', 'allocated', 'mtime', 'atime'])
+                for ts in ['mtime', 'atime']: df[ts] = pd.to_datetime(df[ts], unit='s')
+                df.to_excel(writer, sheet_name=sheet_prefix+'Allocation', index=False)
+                del l, df
+
+                # subtree totals
+                if self.rollups:
+                    df = pd.DataFrame(self.rollups.rows(), columns=['path', 'depth', 'nitems', 'nbytes', 'nalloc', 'max_mtime'])
+                    df['max_mtime'] = pd.to_datetime(df['max_mtime'].where(df['max_mtime'] > 0), unit='s')
+                    df['size'] = df['nbytes'].apply(lambda x: format_size(x))
+                    df['allocated'] = df['nalloc'].apply(lambda x: format_size(x))
+                    df = df[['path','depth','nitems','size','nbytes','allocated','max_mtime']]
+                    df.to_excel(writer, sheet_name=sheet_prefix+'Subtrees', index=False)
+                    del df
+
                 # UID counts
-                udf = pd.DataFrame.from_records([id.to_dict() for id in self.uids.values()])
+                udf = pd.DataFrame.from_records([id.to_dict() for id in self.uids.values()], columns=IDCounts.COLUMNS)
                 udf['groupname'] = udf['name'].apply(lambda x: None)
                 udf.rename(columns={'name': 'username'},inplace=True)
                 udf['size'] = udf['nbytes'].apply(lambda x: format_size(x))
-                udf = udf[['username', 'groupname', 'size', 'nbytes', 'nitems']]
+                udf['deduplicated'] = udf['nbytes_dedup'].apply(lambda x: format_size(x))
+                udf['allocated'] = udf['nalloc'].apply(lambda x: format_size(x))
+                udf = udf[['username', 'groupname', 'size', 'nbytes', 'allocated', 'deduplicated', 'nbytes_dedup', 'nitems']]
 
                 # GID counts
-                gdf = pd.DataFrame.from_records([id.to_dict() for id in self.gids.values()])
+                gdf = pd.DataFrame.from_records([id.to_dict() for id in self.gids.values()], columns=IDCounts.COLUMNS)
                 gdf['username'] = gdf['name'].apply(lambda x: None)
                 gdf.rename(columns={'name': 'groupname'},inplace=True)
                 gdf['size'] = gdf['nbytes'].apply(lambda x: format_size(x))
-                gdf = gdf[['username', 'groupname', 'size', 'nbytes', 'nitems']]
+                gdf['deduplicated'] = gdf['nbytes_dedup'].apply(lambda x: format_size(x))
+                gdf['allocated'] = gdf['nalloc'].apply(lambda x: format_size(x))
+                gdf = gdf[['username', 'groupname', 'size', 'nbytes', 'allocated', 'deduplicated', 'nbytes_dedup', 'nitems']]
 
                 # combined sheet
                 df = pd.concat([udf,gdf],ignore_index=True)
@@ -356,6 +827,30 @@ class MPIClass:
                 df.to_excel(writer, sheet_name=sheet_prefix+'Users & Groups', index=False)
                 del udf, gdf, df
 
+                # size & age histograms, overall then per user & group
+                owners = [('(all)', '(all)', self.histograms.total)]
+                owners += [(self.uids[k].name, None, row) for k,row in self.histograms.uids.items()]
+                owners += [(None, self.gids[k].name, row) for k,row in self.histograms.gids.items()]
+                l = []
+                for username, groupname, row in owners:
+                    for b in np.flatnonzero(row[SIZE_COUNTS]).tolist():
+                        l.append((username, groupname, format_size_bucket(b), size_range(b)[0],
+                                  int(row[SIZE_COUNTS][b]), format_size(int(row[SIZE_BYTES][b])), int(row[SIZE_BYTES][b])))
+                df = pd.DataFrame(l, columns=['username', 'groupname', 'file size', 'from nbytes', 'nfiles', 'size', 'nbytes'])
+                df.to_excel(writer, sheet_name=sheet_prefix+'File Sizes', index=False)
+                l = []
+                for username, groupname, row in owners:
+                    for b, label in enumerate(AGE_LABELS):
+                        if row[MTIME_COUNTS][b] or row[ATIME_COUNTS][b]:
+                            l.append((username, groupname, label,
+                                      int(row[MTIME_COUNTS][b]), format_size(int(row[MTIME_BYTES][b])), int(row[MTIME_BYTES][b]),
+                                      int(row[ATIME_COUNTS][b]), format_size(int(row[ATIME_BYTES][b])), int(row[ATIME_BYTES][b])))
+                df = pd.DataFrame(l, columns=['username', 'groupname', 'age',
+                                              'nfiles (mtime)', 'size (mtime)', 'nbytes (mtime)',
+                                              'nfiles (atime)', 'size (atime)', 'nbytes (atime)'])
+                df.to_excel(writer, sheet_name=sheet_prefix+'File Ages', index=False)
+                del owners, l, df
+
 
             # Ok, open the file and set some formatting
             from openpyxl import Workbook, load_workbook
@@ -384,7 +879,7 @@ class MPIClass:
                                 cell.alignment = Alignment(horizontal='right')
                             if 'nitems' in column[0].value:
                                 cell.number_format = '#,###'
-                            if 'time' in column[0].value:
+                            if column[0].value in TIMESTAMP_COLUMNS:
                                 cell.number_format = 'yyyy-mm-dd h:mm:ss'
 
                         except:
@@ -395,11 +890,14 @@ class MPIClass:
                     ws.column_dimensions[column_letter].width = adjusted_width
 
                     # special widths
-                    if 'time' in column[0].value:
+                    if column[0].value in TIMESTAMP_COLUMNS:
                         ws.column_dimensions[column_letter].width = 20
                     elif 'path' in column[0].value:
                         ws.column_dimensions[column_letter].width = min(adjusted_width,140)
-                    elif 'nbytes' in column[0].value:
+
+                    # raw byte counts, behind their formatted 'size' columns ('from nbytes' is a
+                    # bucket bound, not a total, and stays)
+                    if column[0].value.startswith('nbytes'):
                         ws.column_dimensions[column_letter].hidden = True
 
                     # column label formatting
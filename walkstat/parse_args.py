@@ -2,6 +2,7 @@
 
 import argparse
 import os
+import time
 
 
 
@@ -19,10 +20,34 @@ def parse_options(appname=None):
     parser.add_argument('--heap-size', default=500, type=int, required=False, help='Per-rank heap size used for tracking large files / directories')
     parser.add_argument('--threshold-size', default='10MB', type=str, required=False, help='Only consider directories larger than this threshold when tracking mtimes/atimes (string')
     parser.add_argument('--threshold-count', default=10000, type=int, required=False, help='Only consider directories larger than this threshold when tracking mtimes/atimes (count)')
+    parser.add_argument('--engine', default='manager', choices=['manager', 'steal'], help='Traversal engine: central Manager on rank 0, or decentralized work stealing on all ranks (default: manager)')
+    parser.add_argument('--manager-loop', default='event', choices=['event', 'probe'], help='Manager dispatch loop: service messages in arrival order, or the original per-tag iprobe loop (default: event)')
+    parser.add_argument('--hierarchical', action='store_true', help='Use one sub-manager rank per node, exchanging batches of directories with the Manager')
+    parser.add_argument('--node-size', default=0, type=int, required=False, help='With --hierarchical, group this many consecutive ranks per sub-manager (default: split by shared-memory node)')
+    parser.add_argument('--frontier', default='dfs', choices=['dfs', 'bfs', 'priority'], help='Order in which the Manager hands out directories: depth-first, breadth-first, or largest estimated subtree first (default: dfs)')
+    parser.add_argument('--frontier-memory', default='0', type=str, required=False, help='Keep the dfs frontier as packed bytes, spilling to node-local disk beyond this size (string, default: 0, plain in-memory list)')
+    parser.add_argument('--progress-rma', action='store_true', help='Workers publish progress counters into a one-sided MPI window on rank 0 instead of sending progress messages')
+    parser.add_argument('--scan-threads', default=0, type=int, required=False, help='Scan this many directories at once on each rank, from a rank-local queue fed by the Manager (default: 0, one at a time)')
+    parser.add_argument('--stat-threads', default=0, type=int, required=False, help='stat() directory entries over this many threads per rank, to keep several metadata requests in flight on network filesystems (default: 0, serial)')
+    parser.add_argument('--stat-rate', default=0, type=int, required=False, help='Limit stat() calls to this many per second (default: 0, unlimited)')
+    parser.add_argument('--stat-rate-scope', default='global', choices=['global', 'node'], help='Whether --stat-rate applies to the whole job or to each node (default: global)')
+    parser.add_argument('--id-cache', default=None, type=str, required=False, help='JSON file of uid/gid names, used for the summary in place of directory-service lookups and updated with any new ones')
+    parser.add_argument('--stat-rate-file', default=None, type=str, required=False, help='Control file holding the --stat-rate target, re-read by rank 0 when it changes or on SIGUSR1 (--engine manager only)')
+    parser.add_argument('--wire', default='pickle', choices=['pickle', 'binary'], help='Encoding of directory lists and progress counts between Manager and workers (default: pickle)')
+    parser.add_argument('--split-threshold', default=0, type=int, required=False, help='Split directories with more than this many entries, spreading their stat()s across ranks (default: 0, never split)')
+    parser.add_argument('--split-chunk', default=0, type=int, required=False, help='With --split-threshold, number of names per chunk handed to a rank (default: the split threshold)')
+    parser.add_argument('--prefetch', default=0, type=int, required=False, help='Keep up to this many assigned directories queued on each worker, requesting more while still scanning (default: 0, no prefetch)')
+    parser.add_argument('--send-policy', default='adaptive', choices=['adaptive', 'fixed'], help='When workers ship discovered directories and progress to their Manager: following its backlog and their scan rate, or at fixed counts (default: adaptive)')
+    parser.add_argument('--rollup-depth', default=None, type=int, required=False, help='Also report du -s style totals (items, size, allocated, latest mtime) of every directory down to this depth below each -d directory (default: none)')
+    parser.add_argument('--exclude', default=[], nargs='+', action='extend', help='Skip entries matching any of these rules, directories with everything below them, without stat()ing them: name:NAME, glob:PATTERN, re:REGEX, path:PREFIX, or a plain glob PATTERN')
+    parser.add_argument('--include', default=[], nargs='+', action='extend', help='Only count files (not directories) matching any of these rules, same forms as --exclude')
+    parser.add_argument('--batch-size', default=1, type=int, required=False, help='Maximum number of directories handed to a ready worker at once (default: 1, adaptive below this cap)')
 
     # tool-specific arguments follow
     if 'walktar' == appname:
         parser.add_argument('--tar-queue-depth', default=50000, help='Execution thread queue depth.', type=int, required=False)
+    if 'walkstat' == appname:
+        parser.add_argument('--stat', default='all', choices=['all', 'files', 'none'], help='Which entries to stat(): all of them, only regular files (and other non-directories / non-links), or none - counts and types only, from the directory entries (default: all)')
 
     args = parser.parse_args()
 
@@ -30,12 +55,47 @@ def parse_options(appname=None):
     if 0 >= args.progress:
         args.progress = float('inf')
 
+    args.batch_size = max(1, args.batch_size)
+
+    # walktar archives every entry, so needs them all stat()ed
+    if not hasattr(args, 'stat'):
+        args.stat = 'all'
+
     if '0' == args.threshold_size:
         args.threshold_size = 0
     else:
         from humanfriendly import parse_size
         args.threshold_size = parse_size(args.threshold_size)
 
+    if '0' == args.frontier_memory:
+        args.frontier_memory = 0
+    else:
+        from humanfriendly import parse_size
+        args.frontier_memory = parse_size(args.frontier_memory)
+
+    if args.frontier_memory and 'dfs' != args.frontier:
+        print('ERROR: --frontier-memory requires --frontier dfs')
+        assert(False)
+
+    # the control file is watched by the Manager, and the 'steal' engine has none
+    if args.stat_rate_file and 'steal' == args.engine:
+        print('ERROR: --stat-rate-file requires --engine manager')
+        assert(False)
+
+    # --exclude / --include rules, compiled here once and shipped to every rank with the options
+    args.filter = None
+    if args.exclude or args.include:
+        from filters import EntryFilter
+        import re
+        try:
+            args.filter = EntryFilter(args.exclude, args.include)
+        except re.error as error:
+            print('ERROR: bad --exclude/--include rule: {}'.format(error))
+            assert(False)
+
+    # one reference time for every rank, for file ages
+    args.start_time = time.time()
+
     for d in args.dirs:
         if not os.path.isdir(d):
             print('ERROR: no such directory: {}'.format(d))
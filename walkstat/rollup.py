@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Inclusive subtree totals ('du -s') for every directory down to --rollup-depth below each
+# of the -d directories.
+#
+# Every directory tally a rank finishes (a DirEntry: its direct contents only) is added to
+# each of its ancestors at depth <= --rollup-depth, and to itself if it is that shallow.
+# The partial sums are keyed by path, so ranks' containers simply add up, in a reduction
+# tree at the end of the walk.
+
+import os
+from tree_reduce import tree_reduce
+
+# per-path totals
+NITEMS, NBYTES, NALLOC, MAX_MTIME = range(4)
+
+
+
+################################################################################
+class Rollups:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, roots, depth):
+        # the deepest -d directory containing a path is the one its depth counts from
+        self.roots = sorted(set(os.path.normpath(r) for r in roots), key=len, reverse=True)
+        self.depth = depth
+        self.totals = {} # <--- path : [nitems, nbytes, nalloc, max_mtime]
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def root_of(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep): return root
+        return None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add(self, de):
+        path = os.path.normpath(de.path)
+        root = self.root_of(path)
+        if root is None: return
+
+        parts = path[len(root):].strip(os.sep).split(os.sep)
+        ancestor = root
+        self.bump(ancestor, de.nitems, de.nbytes, de.nalloc, de.max_mtime)
+        for part in parts[:self.depth] if parts[0] else []:
+            ancestor = os.path.join(ancestor, part)
+            self.bump(ancestor, de.nitems, de.nbytes, de.nalloc, de.max_mtime)
+        return
+
+    def bump(self, path, nitems, nbytes, nalloc, max_mtime):
+        t = self.totals.get(path)
+        if t is None:
+            self.totals[path] = [nitems, nbytes, nalloc, max_mtime]
+            return
+        t[NITEMS] += nitems
+        t[NBYTES] += nbytes
+        t[NALLOC] += nalloc
+        t[MAX_MTIME] = max(t[MAX_MTIME], max_mtime)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def merge(self, other):
+        for path, t in other.totals.items(): self.bump(path, *t)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def reduce(self, comm, tag):
+        # sum every rank's partial totals onto rank 0
+        tree_reduce(self, comm, tag)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def rows(self):
+        # [(path, depth, nitems, nbytes, nalloc, max_mtime), ...] in path order, so every
+        # directory is followed by its subdirectories
+        elements = []
+        for path, t in self.totals.items():
+            rel = path[len(self.root_of(path)):].strip(os.sep)
+            elements.append((path, rel.count(os.sep) + 1 if rel else 0, *t))
+        elements.sort(key=lambda e: e[0].split(os.sep))
+        return elements
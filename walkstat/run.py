@@ -13,16 +13,19 @@ size = comm.Get_size()
 # infer the requested action from the calling executable name
 appname = os.path.basename(sys.argv[0])
 
+args = None
 if 0 == rank:
     args = parse_options(appname)
-
-assert size > 1
+    assert size > 1 or 'steal' == args.engine
 
 comm.Barrier()
 
-# workers on ranks [1,size)
-if rank:
-    worker = worker_factory(appname)
+# workers on ranks [1,size), or on every rank with the work-stealing engine
+if rank or 'steal' == args.engine:
+    if 0 == rank:
+        print('Running {} on {} MPI ranks (work stealing)'.format(appname,size))
+        sys.stdout.flush()
+    worker = worker_factory(appname, options=args)
     worker.run()
     worker.summary()
 
@@ -7,9 +7,11 @@ from base_worker import BaseWorker
 ################################################################################
 class StatWorker(BaseWorker):
 
+    has_file_hook = False
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    def __init__(self):
-        BaseWorker.__init__(self)
+    def __init__(self, options=None):
+        BaseWorker.__init__(self,options)
         return
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
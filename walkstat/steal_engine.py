@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+from mpi4py import MPI
+from mpiclass import format_size, format_number, format_timespan
+import numpy as np
+import sys
+from datetime import datetime
+
+################################################################################
+class StealEngine:
+
+    # Decentralized traversal used with '--engine steal', after workthief2.py.  Every rank,
+    # including rank 0, walks directories from its own queue with the worker's usual
+    # process_directory() accounting, and ranks that run dry steal from a peer instead of
+    # asking a central Manager.
+    #
+    # Termination: the walk proceeds in epochs, each closed by a nonblocking barrier.  A rank
+    # enters the barrier once it is idle or someone has asked it for work, and only after all
+    # of the work it handed out has been received.  Once inside the barrier it stops giving
+    # work away, so when the barrier completes no work is in flight and a single Allreduce
+    # of queue lengths tells everyone, in O(log P), whether the walk is finished.
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, worker):
+        self.worker = worker
+        self.comm = worker.comm
+        self.tags = worker.tags
+        self.rank = worker.rank
+        self.nranks = worker.nranks
+        self.options = worker.options
+
+        self.queue = list(self.options.dirs) if worker.i_am_root else []
+        self.last_steal = self.rank
+        self.victim = None                 # <--- rank we are waiting to hear back from, if any
+        self.steal_request = MPI.REQUEST_NULL
+        self.replies = []                  # <--- our outstanding work replies
+        self.barrier = None
+        self.asked = False                 # <--- somebody asked us for work this epoch
+        self.nepochs = 0
+        self.nsteals = 0
+        self.ngiven = 0
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def next_victim(self):
+        self.last_steal = (self.last_steal + 1) % self.nranks
+        if self.last_steal == self.rank:
+            self.last_steal = (self.last_steal + 1) % self.nranks
+        return self.last_steal
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def split_queue(self):
+        # give away the older half of our queue - shallowest, hence largest, subtrees
+        if len(self.queue) < 2: return []
+        front = self.queue[:len(self.queue)//2]
+        del self.queue[:len(front)]
+        return front
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def poll(self):
+        # service steal traffic.  also called from the worker's progress hook, so
+        # we stay responsive while scanning huge directories.
+        status = MPI.Status()
+
+        while self.comm.iprobe(source=MPI.ANY_SOURCE,
+                               tag=self.tags['work_request'],
+                               status=status):
+            thief = status.Get_source()
+            self.comm.recv(source=thief, tag=self.tags['work_request'])
+            self.asked = True
+            # always answer, empty handed once we are in the barrier
+            work = [] if self.barrier is not None else self.split_queue()
+            if work: self.ngiven += 1
+            self.replies.append(self.comm.issend(work, dest=thief, tag=self.tags['work_reply']))
+
+        if self.victim is not None and self.comm.iprobe(source=self.victim, tag=self.tags['work_reply']):
+            work = self.comm.recv(source=self.victim, tag=self.tags['work_reply'])
+            self.steal_request.Wait() # (matched by now)
+            self.queue.extend(work)
+            self.victim = None
+
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def steal(self):
+        # at most one outstanding request, round-robin over our peers
+        if self.victim is not None or self.nranks == 1: return
+        self.victim = self.next_victim()
+        self.nsteals += 1
+        self.steal_request = self.comm.issend(None, dest=self.victim, tag=self.tags['work_request'])
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def process_next(self):
+        self.worker.process_item(self.queue.pop())
+        # collect whatever the worker found that it has not handed us yet
+        self.worker.send_my_dirlist()
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def report_progress(self, totals, elapsed):
+        status = '[{}] Walked {} items / {} in {} ({} items/sec) [queued={}, epochs={}]'.format(datetime.now().isoformat(sep=' ', timespec='seconds'),
+                                                                                                format_number(int(totals[1])),
+                                                                                                format_size(int(totals[2])),
+                                                                                                format_timespan(elapsed),
+                                                                                                format_number(int(float(totals[1])/max(elapsed,1e-6))),
+                                                                                                format_number(int(totals[0])),
+                                                                                                format_number(self.nepochs))
+        print(status)
+        sys.stdout.flush()
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run(self):
+
+        self.comm.Barrier()
+        start_time = progress_time = MPI.Wtime()
+        mine = np.zeros(3, dtype=np.int64)
+        totals = np.zeros(3, dtype=np.int64)
+
+        while True:
+
+            # one epoch
+            self.nepochs += 1
+            self.barrier = None
+            self.asked = False
+
+            while True:
+                self.poll()
+
+                if self.queue:
+                    self.process_next()
+                else:
+                    self.steal()
+
+                if self.barrier is None:
+                    # everything we gave away must have been received before we enter
+                    if (self.asked or not self.queue) and MPI.Request.Testall(self.replies):
+                        self.replies = []
+                        self.barrier = self.comm.Ibarrier()
+                elif self.barrier.Test():
+                    break
+
+            # consistent state, nothing in flight: are we done?
+            mine[:] = [len(self.queue), self.worker.num_items, self.worker.total_size]
+            self.comm.Allreduce(mine, totals)
+
+            if self.worker.i_am_root and (MPI.Wtime() - progress_time) > self.options.progress:
+                progress_time = MPI.Wtime()
+                self.report_progress(totals, progress_time - start_time)
+
+            if 0 == totals[0]: break
+
+        # clean up outstanding steal traffic.  requests are always answered (only with empty
+        # replies by now), so keep servicing them until every rank has heard back from its victim.
+        while self.victim is not None: self.poll()
+        done = self.comm.Ibarrier()
+        while not done.Test(): self.poll()
+        MPI.Request.Waitall(self.replies)
+
+        nsteals = self.comm.reduce(self.nsteals)
+        ngiven = self.comm.reduce(self.ngiven)
+        if self.worker.i_am_root:
+            self.report_progress(totals, MPI.Wtime() - start_time)
+            print('  --> Work stealing completed in {} epochs ({} steal requests / {} satisfied)'.format(format_number(self.nepochs),
+                                                                                                         format_number(nsteals),
+                                                                                                         format_number(ngiven)))
+        return
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+from mpi4py import MPI
+from manager import IDLE_MIN, IDLE_MAX
+from frontier import make_frontier
+import time
+
+# after the Manager answers a 'dir_request' with nothing, wait this long (seconds) before asking again
+REQUEST_BACKOFF = 0.25
+
+################################################################################
+class SubManager:
+
+    # Node-local manager used with --hierarchical.  One worker rank per node takes on
+    # this role: it serves the other ranks on its node from a node-local frontier using
+    # the same ready/execute/dir_reply/progress protocol as the Manager, and only
+    # exchanges surplus or deficit batches of directories with the Manager on rank 0.
+    # To the Manager it looks like a single (large) worker.
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, worker):
+        self.worker = worker
+        self.comm = worker.comm
+        self.tags = worker.tags
+        self.rank = worker.rank
+        self.options = worker.options
+        self.workers = worker.submanagers[self.rank]
+        self.dirs = make_frontier(self.options.frontier, memory=self.options.frontier_memory)
+        self.waiting = []         # <--- local workers blocked waiting on their next 'execute'
+        self.requested = False    # <--- outstanding 'dir_request' to the Manager?
+        self.request_time = 0
+        self.progress_sizes = dict((p, 0) for p in self.workers)
+        self.progress_counts = dict((p, 0) for p in self.workers)
+        self.progress_time = MPI.Wtime()
+
+        # keep about a batch per local worker on hand, ask the Manager for more below
+        # that, and send the older half of our frontier upstream well above it
+        self.low_water = len(self.workers)
+        self.high_water = 4*len(self.workers)*self.options.batch_size
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def counts(self):
+        # node totals, reported upstream as if we were a single worker
+        return [sum(self.progress_counts.values()), sum(self.progress_sizes.values())]
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def next_batch(self):
+        # same adaptive share as Manager.next_batch(), over our node-local workers
+        count = max(1, min(self.options.batch_size, len(self.dirs) // (2*len(self.workers))))
+        return self.dirs.pop(count)
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def send_execute(self, dest, next_dirs, costs):
+        # with our node-local backlog per worker, as in Manager.send_execute()
+        self.worker.send_dirs(dest, self.tags['execute'], next_dirs, [len(self.dirs) // len(self.workers)], costs)
+        return
+
+
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def run(self):
+
+        self.comm.Barrier()
+        status = MPI.Status()
+        idle = 0.
+
+        while True:
+
+            # nothing pending - back off a little rather than spin a core (see Manager.run_event())
+            if not self.comm.iprobe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG):
+                idle = min(2*idle or IDLE_MIN, IDLE_MAX)
+                time.sleep(idle)
+            else:
+                idle = 0.
+
+            # service messages strictly in arrival order.  a worker sends its 'dir_reply' right
+            # before its 'ready', so probing tag-by-tag could see it idle while its directories
+            # are still in flight.  with only a handful of workers we can afford to receive every
+            # 'ready' right away and remember who is waiting, rather than leaving them queued.
+            while self.comm.iprobe(source=MPI.ANY_SOURCE,
+                                   tag=MPI.ANY_TAG,
+                                   status=status):
+                source = status.Get_source()
+                tag = status.Get_tag()
+                msg, counts, costs = self.worker.recv_dirs(source=source, tag=tag, status=status)
+
+                # answer to an earlier 'dir_request'
+                if 0 == source:
+                    assert (tag == self.tags['execute'] and self.requested)
+                    self.requested = False
+                    if not msg: self.request_time = MPI.Wtime()
+                    self.dirs.push(msg, costs)
+                    continue
+
+                # workers include their counts with every message
+                self.progress_counts[source], self.progress_sizes[source] = counts
+
+                if   tag == self.tags['dir_reply']: self.dirs.push(msg, costs)
+                elif tag == self.tags['ready']:     self.waiting.append(source)
+
+                # a prefetching worker running low, answered right away, possibly empty handed
+                elif tag == self.tags['dir_request']:
+                    next_dirs, costs = self.next_batch() if self.dirs else ([], None)
+                    self.send_execute(source, next_dirs, costs)
+
+            # keep our workers busy
+            while self.waiting and self.dirs:
+                next_dirs, costs = self.next_batch()
+                self.send_execute(self.waiting.pop(0), next_dirs, costs)
+
+            # whole node is idle: report ready to the Manager, exactly like a worker would, and
+            # block until it either has more work for us or tells us to terminate
+            if not self.dirs and not self.requested and len(self.waiting) == len(self.workers):
+                self.worker.send_dirs(0, self.tags['ready'], counts=self.counts())
+                # (from any source: 'terminate' may be forwarded by a peer.  our own workers
+                # are all waiting on us, so nothing else can arrive here)
+                more_dirs, counts, costs = self.worker.recv_dirs(status=status)
+                if status.Get_tag() == self.tags['terminate']:
+                    self.worker.forward_terminate(counts)
+                    break
+                self.dirs.push(more_dirs, costs)
+                continue
+
+            # deficit: ask for more before our workers go idle
+            if len(self.dirs) < self.low_water:
+                if not self.requested and (MPI.Wtime() - self.request_time) > REQUEST_BACKOFF:
+                    self.worker.send_dirs(0, self.tags['dir_request'], counts=self.counts())
+                    self.requested = True
+
+            # surplus: ship half of our frontier to the Manager - the older (shallower)
+            # half, or the most expensive half with --frontier priority
+            elif len(self.dirs) > self.high_water and not self.waiting:
+                surplus, costs = self.dirs.split()
+                self.worker.send_dirs(0, self.tags['dir_reply'], surplus, self.counts(), costs)
+
+            # forward node progress periodically (unless our workers publish it themselves, --progress-rma)
+            if not self.worker.progress_win and (MPI.Wtime() - self.progress_time) > self.options.progress:
+                self.progress_time = MPI.Wtime()
+                self.worker.send_dirs(0, self.tags['progress'], counts=self.counts())
+
+        # done, release our workers
+        assert (len(self.waiting) == len(self.workers))
+        self.worker.forward_terminate(self.waiting)
+
+        return
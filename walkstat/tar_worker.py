@@ -23,8 +23,8 @@ class TarWorker(BaseWorker):
 
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    def __init__(self):
-        BaseWorker.__init__(self)
+    def __init__(self, options=None):
+        BaseWorker.__init__(self,options)
 
         self.tar = None
         self.tar_cnt  = 0
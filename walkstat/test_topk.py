@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+# TopK with --heap-size 0 (python -m pytest test_topk.py)
+
+from topk import TopK
+from mpiclass import FileEntry
+
+
+
+################################################################################
+def test_heap_size_zero():
+    top = TopK(0, FileEntry)
+    top.add((10, FileEntry('/a', 10, 4096, 1., 1., 1.)))
+    top.add_arrays([20, 30], ['/b', '/c'], nbytes=[20, 30], nalloc=[0, 0], mtime=[2., 3.], ctime=[2., 3.], atime=[2., 3.])
+
+    other = TopK(0, FileEntry)
+    other.add((40, FileEntry('/d', 40, 4096, 4., 4., 4.)))
+    top.merge(other)
+
+    assert top.top() == []
+    assert len(top) == 0
+    assert top.threshold() is None
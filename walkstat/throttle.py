@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Metadata rate governor for '--stat-rate'.
+#
+# The target is a number of stat() calls per second, either for the whole job or for each
+# node ('--stat-rate-scope').  Every scanning rank enforces its even share of it with a token
+# bucket, and the Manager may hand out a new target mid-run (see Manager.check_throttle()).
+
+import time
+
+# how many seconds worth of tokens a bucket may save up
+BURST_SECONDS = 0.5
+
+# while throttled, check for a new target at least this often (seconds)
+POLL_INTERVAL = 1.0
+
+
+
+################################################################################
+def read_rate_file(filename):
+    # the control file holds a single number of stat()s per second, 0 for no limit.
+    # returns None if it is missing or unreadable, so the current rate stays.
+    try:
+        with open(filename) as f:
+            return max(0, int(float(f.read().split()[0])))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+
+################################################################################
+class TokenBucket:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, rate=0., on_wait=None):
+        self.on_wait = on_wait # <--- called (at most every POLL_INTERVAL) while we are holding back
+        self.tokens = 0.
+        self.stamp = time.monotonic()
+        self.poll_time = self.stamp
+        self.waited = 0.
+        self.set_rate(rate)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def set_rate(self, rate):
+        # 0 means unlimited
+        self.rate = rate
+        self.capacity = max(1., rate*BURST_SECONDS)
+        self.tokens = min(self.tokens, self.capacity)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def take(self, n=1):
+        if not self.rate: return
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp)*self.rate)
+        self.stamp = now
+        self.tokens -= n
+        if self.tokens >= 0: return
+
+        # in debt: sleep it off, in slices so we notice a new target soon enough
+        while self.rate and self.tokens < 0:
+            if self.on_wait and (now - self.poll_time) > POLL_INTERVAL:
+                self.poll_time = now
+                self.on_wait()
+                if not self.rate: break
+            nap = min(-self.tokens/self.rate, POLL_INTERVAL)
+            time.sleep(nap)
+            self.waited += nap
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp)*self.rate)
+            self.stamp = now
+        return
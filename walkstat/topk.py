@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Array-backed, mergeable "top k" container for the largest / oldest files & directories.
+#
+# Drop-in for the MaxHeap use in MPIClass: elements go in as (key, entry) tuples, where entry
+# is a FileEntry or DirEntry NamedTuple, and top() hands them back the same way, largest
+# first, ties broken on the entry exactly as heapq would.  Internally there are no tuples:
+#
+#   keys            : one numpy array
+#   numeric fields  : one numpy column each (nbytes, mtime, ...)
+#   paths           : one bytes buffer of NUL-terminated, fs-encoded paths, plus end offsets
+#
+# New elements collect in a small pending list and are folded into the arrays a batch at
+# a time, which are cut back to the k largest with argpartition whenever they reach 2k.
+# Everything below the k-th largest key as of the last cut is rejected without being
+# stored (threshold()).
+# Containers merge pairwise, so summary() combines all ranks in a reduction tree.
+
+import os
+import numpy as np
+from tree_reduce import tree_reduce
+
+
+
+################################################################################
+class TopK:
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __init__(self, k, entry_type, key_type=int):
+        self.k = k
+        self.entry_type = entry_type
+        self.key_dtype = np.float64 if float == key_type else np.int64
+        # every entry field but the (first) path is a numpy column
+        self.fields = [(name, np.float64 if float == t else np.int64)
+                       for name, t in entry_type.__annotations__.items()][1:]
+
+        self.keys = np.empty(0, dtype=self.key_dtype)
+        self.columns = dict((name, np.empty(0, dtype=dtype)) for name, dtype in self.fields)
+        self.path_data = b''
+        self.path_ends = np.empty(0, dtype=np.int64)
+        self.floor = None  # <--- k-th largest key kept so far, nothing below it can get in
+        self.pending = []         # <--- (key, entry) tuples from add()
+        self.pending_arrays = []  # <--- (keys, paths, columns) from add_arrays()
+        self.npending = 0
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def __len__(self):
+        self.settle()
+        return len(self.keys)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def threshold(self):
+        # a lower bound on what can still get in (None: anything), so callers can skip
+        # building candidates below it at all
+        return self.floor
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add(self, element):
+        if self.floor is not None and element[0] < self.floor: return
+        self.pending.append(element)
+        self.npending += 1
+        if self.npending >= self.k: self.flush()
+        return
+
+    def add_many(self, elements):
+        for element in elements: self.add(element)
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def add_arrays(self, keys, paths, **columns):
+        # batch insert straight from arrays (one per entry field), no tuples built at all
+        keys = np.asarray(keys, dtype=self.key_dtype)
+        if self.floor is not None:
+            keep = np.flatnonzero(keys >= self.floor)
+            if not len(keep): return
+            keys = keys[keep]
+            paths = [paths[i] for i in keep.tolist()]
+            columns = dict((name, np.asarray(col)[keep]) for name, col in columns.items())
+        self.pending_arrays.append((keys, paths, columns))
+        self.npending += len(keys)
+        if self.npending >= self.k: self.flush()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def flush(self):
+        # fold everything pending into the arrays, all in one go
+        if not self.npending: return
+        chunks, self.pending_arrays = self.pending_arrays, []
+        if self.pending:
+            pending, self.pending = self.pending, []
+            chunks.append((np.array([key for key, entry in pending], dtype=self.key_dtype),
+                           [entry.path for key, entry in pending],
+                           dict((name, [getattr(entry, name) for key, entry in pending]) for name, dtype in self.fields)))
+        self.npending = 0
+
+        self.append(np.concatenate([keys for keys, paths, columns in chunks]),
+                    encode([p for keys, paths, columns in chunks for p in paths]),
+                    dict((name, np.concatenate([np.asarray(columns[name], dtype=dtype) for keys, paths, columns in chunks]))
+                         for name, dtype in self.fields))
+        return
+
+    def settle(self):
+        # everything pending folded in, and cut back to (at most) k
+        self.flush()
+        self.compact()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def append(self, keys, path_blob, columns):
+        data, ends = path_blob
+        self.keys = np.concatenate((self.keys, keys))
+        for name, dtype in self.fields:
+            self.columns[name] = np.concatenate((self.columns[name], np.asarray(columns[name], dtype=dtype)))
+        self.path_ends = np.concatenate((self.path_ends, ends + len(self.path_data)))
+        self.path_data += data
+        if len(self.keys) >= 2*self.k: self.compact()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def compact(self):
+        # keep only the k largest (by key, then entry - exactly what heapq would keep)
+        if self.k <= 0:
+            self.select(np.empty(0, dtype=np.int64)) # <--- --heap-size 0: keep nothing, no floor
+            return
+        n = len(self.keys)
+        if n > self.k:
+            kth = self.keys[np.argpartition(self.keys, n - self.k)[n - self.k]]
+            above = np.flatnonzero(self.keys > kth)
+            ties = np.flatnonzero(self.keys == kth).tolist()
+            if len(above) + len(ties) > self.k:
+                ties = sorted(ties, key=self.entry, reverse=True)[:self.k - len(above)]
+            self.select(np.concatenate((above, np.array(ties, dtype=np.int64))))
+        if len(self.keys) == self.k:
+            self.floor = self.keys.min().item()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def select(self, idx):
+        idx = np.sort(idx)
+        starts = np.concatenate(([0], self.path_ends[:-1]))
+        data = b''.join(self.path_data[s:e] for s, e in zip(starts[idx].tolist(), self.path_ends[idx].tolist()))
+        self.path_ends = np.cumsum(self.path_ends[idx] - starts[idx])
+        self.path_data = data
+        self.keys = self.keys[idx]
+        for name, dtype in self.fields:
+            self.columns[name] = self.columns[name][idx]
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def path(self, i):
+        start = self.path_ends[i-1] if i else 0
+        return os.fsdecode(self.path_data[start:self.path_ends[i]-1])
+
+    def entry(self, i):
+        return self.entry_type(self.path(i), *(self.columns[name][i].item() for name, dtype in self.fields))
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def top(self, count=None):
+        # [(key, entry), ...], largest first
+        self.settle()
+        elements = [(key, self.entry(i)) for i, key in enumerate(self.keys.tolist())]
+        elements.sort(reverse=True)
+        return elements[:count] if count else elements
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def merge(self, other):
+        other.settle()
+        self.flush()
+        self.append(other.keys, (other.path_data, other.path_ends), other.columns)
+        self.compact()
+        return
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def reduce(self, comm, tag):
+        # merge every rank's container onto rank 0 over a binomial tree: log2(P) merges
+        # of at most k elements each on the way up, rather than P lists at once on rank 0
+        self.settle()
+        tree_reduce(self, comm, tag)
+        return
+
+
+
+################################################################################
+def encode(paths):
+    # NUL-terminated, fs-encoded paths and their end offsets
+    encoded = [os.fsencode(p) + b'\0' for p in paths]
+    ends = np.cumsum([len(e) for e in encoded], dtype=np.int64) if encoded else np.empty(0, dtype=np.int64)
+    return b''.join(encoded), ends
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+# Binomial tree reduction of mergeable containers (TopK, Rollups) onto rank 0.
+
+
+
+################################################################################
+def tree_reduce(obj, comm, tag):
+    # merge every rank's 'obj' into rank 0's, with obj.merge(other): log2(P) merges on the
+    # way up, rather than P containers at once on rank 0.  every rank but 0 ends up having
+    # sent its 'obj' away (and keeps it as it was).
+    rank = comm.Get_rank()
+    nranks = comm.Get_size()
+    step = 1
+    while step < nranks:
+        if rank % (2*step):
+            comm.send(obj, dest=rank-step, tag=tag)
+            break
+        if rank + step < nranks:
+            obj.merge(comm.recv(source=rank+step, tag=tag))
+        step *= 2
+    return
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compact binary encoding for Manager <-> worker messages ('--wire binary').
+#
+# Every message is a (possibly empty) batch of directory paths plus a few integer counters,
+# and optionally a cost estimate per path ('--frontier priority'), packed into one contiguous
+# uint8 buffer that travels with the buffer-based Send/Recv:
+#
+#   int64[3]          header   : number of counters, number of paths, number of costs
+#   int64[ncounts]    counters
+#   int64[ncosts]     costs
+#   uint8[...]        data     : the paths, NUL-separated and encoded as os.fsencode() would
+#
+# A path can never contain NUL, so the separators stand in for an offsets array and the whole
+# batch is encoded and decoded with a single call on each end - no pickling, and no
+# per-object work beyond creating the strings themselves.
+
+import sys
+import numpy as np
+
+HEADER = np.dtype(np.int64).itemsize
+ENCODING = sys.getfilesystemencoding()
+ERRORS = sys.getfilesystemencodeerrors()
+
+
+
+################################################################################
+def encode_paths(dirs):
+    return '\0'.join(dirs).encode(ENCODING, ERRORS)
+
+def decode_paths(data):
+    dirs = data.decode(ENCODING, ERRORS).split('\0')
+    # chunks of split directories (see base_worker.make_split_chunk()) start with a NUL,
+    # which shows up as an empty field - reattach it to the field that follows
+    if '' in dirs:
+        fields = iter(dirs)
+        dirs = [f if f else '\0' + next(fields) for f in fields]
+    return dirs
+
+
+
+################################################################################
+def pack(dirs=None, counts=None, costs=None):
+    counts = counts if counts else []
+    costs = costs if costs else []
+    npaths = len(dirs) if dirs else 0
+    data = encode_paths(dirs) if npaths else b''
+
+    header = np.empty(3 + len(counts) + len(costs), dtype=np.int64)
+    header[0] = len(counts)
+    header[1] = npaths
+    header[2] = len(costs)
+    header[3:3+len(counts)] = counts
+    header[3+len(counts):] = costs
+
+    buf = np.empty(header.nbytes + len(data), dtype=np.uint8)
+    buf[:header.nbytes] = header.view(np.uint8)
+    buf[header.nbytes:] = np.frombuffer(data, dtype=np.uint8)
+    return buf
+
+
+
+################################################################################
+def unpack(buf):
+    ncounts, npaths, ncosts = buf[:3*HEADER].view(np.int64).tolist()
+    start = 3*HEADER
+    counts = buf[start:start + ncounts*HEADER].view(np.int64).tolist()
+    start += ncounts*HEADER
+    costs = buf[start:start + ncosts*HEADER].view(np.int64).tolist()
+    start += ncosts*HEADER
+
+    dirs = decode_paths(buf[start:].tobytes()) if npaths else []
+    assert (len(dirs) == npaths)
+    return dirs, counts, costs
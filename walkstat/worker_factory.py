@@ -6,10 +6,10 @@ from tar_worker import TarWorker
 
 
 ################################################################################
-def worker_factory(type='stat'):
+def worker_factory(type='stat', options=None):
 
-    if   'walkstat' == type: return StatWorker()
-    elif 'walktar'  == type: return TarWorker()
+    if   'walkstat' == type: return StatWorker(options)
+    elif 'walktar'  == type: return TarWorker(options)
     else:
         print('ERROR: Unrecognized worker type: {}'.format(type))
         raise NotImplementedError